@@ -0,0 +1,143 @@
+"""
+Microbenchmark for parsing Notion pages into workout/exercise rows.
+
+    python -m benchmarks.notion_parse [pages.json]
+
+pages.json is a list of page objects as returned by the Notion database query API (e.g.
+the results of fetch_all_workouts_and_exercises dumped to disk). Without it, 10k pages
+shaped like the workouts and exercises databases are generated.
+"""
+import json
+import random
+import sys
+import time
+import workouts.notion as notion
+
+PAGES = 10_000
+
+def rich_text(text):
+    return {"type": "rich_text", "rich_text": [{"plain_text": text}] if text else []}
+
+def workout_page(i):
+    return {
+        "id": f"{i:08x}-0000-0000-0000-000000000000",
+        "properties": {
+            "Name": {"type": "title", "title": [{"plain_text": f"Workout {i}"}]},
+            "Date": {"type": "date", "date": {"start": f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}"}},
+            "Personal Notes": rich_text("felt strong" if i % 3 else ""),
+            "Coach Notes": rich_text("add weight next week" if i % 5 else ""),
+            "Type": {"type": "select", "select": {"name": random.choice(["Push", "Pull", "Legs"])}},
+            "Exercises": {"type": "relation", "relation": [{"id": f"{i}-{j}"} for j in range(6)]},
+            "Volume": {"type": "rollup", "rollup": {"number": 1234}},
+            "Done": {"type": "checkbox", "checkbox": True},
+        },
+    }
+
+def exercise_page(i):
+    return {
+        "id": f"{i:08x}-1111-0000-0000-000000000000",
+        "properties": {
+            "Exercise": {"type": "select", "select": {"name": random.choice(["Squat", "Bench Press", "Bicep Curl"])}},
+            "Workout": {"type": "relation", "relation": [{"id": f"{i // 6:08x}-0000-0000-0000-000000000000"}]},
+            "Variation": {"type": "multi_select", "multi_select": [{"name": "Incline"}, {"name": "Dumbbell"}][: i % 3]},
+            "Sets": {"type": "number", "number": 3},
+            "Reps": {"type": "number", "number": 8 + i % 5},
+            "Weight": {"type": "number", "number": 20 + i % 60},
+            "RIR": {"type": "number", "number": i % 4},
+            "Notes": rich_text("slow eccentric" if i % 2 else ""),
+            "1RM": {"type": "formula", "formula": {"number": 100}},
+            "Status": {"type": "status", "status": {"name": "Done"}},
+        },
+    }
+
+def legacy_flatten(properties):
+    """The if/elif walk the parser used before the schema-compiled extractors."""
+    result = {}
+    for key, prop in properties.items():
+        prop_type = prop.get("type")
+        if prop_type == "rich_text":
+            texts = prop.get("rich_text", [])
+            value = texts[0]["plain_text"] if texts else ""
+        elif prop_type == "multi_select":
+            value = [item["name"] for item in prop.get("multi_select", [])]
+        elif prop_type == "select":
+            selected = prop.get("select")
+            value = selected["name"] if selected else None
+        elif prop_type == "number":
+            value = prop.get("number")
+        elif prop_type == "date":
+            date_obj = prop.get("date")
+            value = date_obj.get("start") if date_obj else None
+        elif prop_type == "checkbox":
+            value = prop.get("checkbox")
+        elif prop_type == "title":
+            title = prop.get("title", [])
+            value = title[0]["plain_text"] if title else ""
+        elif prop_type in ["url", "email", "phone_number"]:
+            value = prop.get(prop_type)
+        elif prop_type == "people":
+            value = [person.get("name") or person.get("id") for person in prop.get("people", [])]
+        elif prop_type == "relation":
+            value = [rel["id"] for rel in prop.get("relation", [])]
+        elif prop_type == "status":
+            value = prop.get("status", {}).get("name")
+        else:
+            continue
+        result[key.lower().replace(" ", "_")] = value
+    return json.dumps(result)
+
+def legacy_rich_text(prop):
+    texts = prop.get("rich_text", [])
+    return texts[0]["plain_text"] if texts else ""
+
+def legacy_parse(page):
+    props = page["properties"]
+    if "Exercise" not in props:
+        return (page["id"].replace("-", ""), props["Date"]["date"]["start"],
+                legacy_rich_text(props["Personal Notes"]), legacy_rich_text(props["Coach Notes"]),
+                legacy_flatten(props))
+
+    relation = props.get("Workout", {}).get("relation", [])
+    if not relation:
+        return None
+    variation = ' '.join(sorted(item["name"] for item in props["Variation"]["multi_select"]))
+    return (relation[0]["id"].replace("-", ""), props["Exercise"]["select"]["name"], variation,
+            props["Sets"]["number"], props["Reps"]["number"], props["Weight"]["number"], 0,
+            legacy_rich_text(props["Notes"]), legacy_flatten(props))
+
+def parse(page):
+    if "Exercise" in page["properties"]:
+        return notion.parse_exercise(page)
+    return notion.parse_workout(page)
+
+def bench(label, fn, pages, rounds=5):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for page in pages:
+            fn(page)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<10} {best * 1000:8.1f} ms  {len(pages) / best:10.0f} pages/s")
+    return best
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            pages = json.load(f)
+        pages = (pages * (PAGES // len(pages) + 1))[:PAGES]
+    else:
+        random.seed(0)
+        pages = [workout_page(i) if i % 7 == 0 else exercise_page(i) for i in range(PAGES)]
+
+    for page in pages[:100]:
+        parsed, expected = parse(page), legacy_parse(page)
+        if parsed and (parsed[:-1] != expected[:-1] or json.loads(parsed[-1]) != json.loads(expected[-1])):
+            raise SystemExit(f"parsed rows differ for page {page['id']}")
+
+    print(f"{len(pages)} pages")
+    legacy = bench("legacy", legacy_parse, pages)
+    compiled = bench("compiled", parse, pages)
+    print(f"speedup    {legacy / compiled:8.2f}x")
+
+if __name__ == "__main__":
+    main()
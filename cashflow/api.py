@@ -2,20 +2,30 @@
 
 from __future__ import annotations
 
-from datetime import date
+import asyncio
+import base64
+import json
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from enum import Enum
 from typing import Optional
 from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Request, Query, Response, status
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from versions import etag_response
 from pydantic import BaseModel, Field, validator
 from cashflow.data import ( 
     fetch_accounts, upsert_account,
     upsert_recurring_item, fetch_recurring_items, delete_recurring_item, upsert_recurring_item_override, fetch_recurring_items_overrides, delete_recurring_item_override,
     upsert_single_item, fetch_single_items, delete_single_item,  upsert_single_item_override, fetch_single_items_overrides, delete_single_item_override,
     upsert_scenario, fetch_scenarios,
-    fetch_account_movements )
+    fetch_account_movements,
+    fetch_category_analytics, PROJECTION_TABLES,
+    publish_projections, request_projection_publish,
+    export_snapshot, import_snapshot,
+    explain_projections )
+from cashflow.projection import combined_items
 
 router = APIRouter()
 
@@ -109,14 +119,61 @@ class EditScenarioRequest(BaseModel):
     name: str
     description: str
 
+# ---------- Paging ----------
+# Cursors are the ordering key of the last row of a page, base64 encoded so clients treat them as opaque.
+def encode_cursor(values) -> str:
+    raw = json.dumps([str(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str], *parsers) -> Optional[tuple]:
+    """
+    The values of a cursor, each checked by the parser at its position, so a tampered
+    cursor is a 400 rather than a type error from the database.
+    """
+    if cursor is None:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(parsers) or not all(isinstance(v, str) for v in values):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return tuple(parse(v) for parse, v in zip(parsers, values))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def cursor_uuid(value: str) -> str:
+    return str(UUID(value))
+
+# Cursor layouts of the listings, matching their ORDER BY
+ITEM_CURSOR = (date.fromisoformat, str, str, cursor_uuid)
+MOVEMENT_CURSOR = (date.fromisoformat, int)
+
+def set_next_cursor(response: Response, rows, limit: Optional[int], *keys: str):
+    # A full page means there may be more; the client stops when the header is absent
+    if limit is not None and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1][k] for k in keys)
+
 #--- Recurring items ---
 
 @router.get("/recurring")
-def get_recurring_items(accountId: Optional[str] = Query(None)):
-    return fetch_recurring_items(accountId)
+def get_recurring_items(
+    request: Request,
+    response: Response,
+    accountId: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=1000)):
+    not_modified = etag_response(request, response, "recurring_items")
+    if not_modified:
+        return not_modified
+    rows = fetch_recurring_items(accountId, decode_cursor(cursor, *ITEM_CURSOR), limit)
+    set_next_cursor(response, rows, limit, "dateFrom", "category", "description", "id")
+    return rows
 
 @router.post("/recurring", status_code=status.HTTP_202_ACCEPTED, summary="Upsert recurring item")
-def upsert_recurring_item_api(payload: UpsertRecurringItemRequest):
+def upsert_recurring_item_api(payload: UpsertRecurringItemRequest, background_tasks: BackgroundTasks):
     effective_id = payload.id or uuid4()
     upsert_recurring_item(
         id=effective_id,
@@ -131,21 +188,26 @@ def upsert_recurring_item_api(payload: UpsertRecurringItemRequest):
         enabled=payload.enabled,
         account_id = payload.accountId
     )
+    background_tasks.add_task(request_projection_publish)
     return {"status": "ok", "id": str(effective_id)}
 
 @router.delete("/recurring/{item_id}", status_code=status.HTTP_202_ACCEPTED, summary="Delete recurring item")
-def delete_recurring_item_api(item_id: UUID):
+def delete_recurring_item_api(item_id: UUID, background_tasks: BackgroundTasks):
     deleted = delete_recurring_item(id=item_id)
+    background_tasks.add_task(request_projection_publish)
     return {"status": "deleted" if deleted else "not_found", "id": str(item_id)}
 
 # --- Recurring overrides
 
 @router.get("/recurring-override")
-def get_recurring_overrides(accountId: Optional[str] = Query(None), scenarioId: Optional[str] = Query(None)):
+def get_recurring_overrides(request: Request, response: Response, accountId: Optional[str] = Query(None), scenarioId: Optional[str] = Query(None)):
+    not_modified = etag_response(request, response, "recurring_overrides")
+    if not_modified:
+        return not_modified
     return fetch_recurring_items_overrides(accountId, scenarioId)
 
 @router.post("/recurring-override", status_code=status.HTTP_202_ACCEPTED, summary="Upsert recurring override")
-def upsert_recurring_override_api(payload: UpsertRecurringOverrideRequest):
+def upsert_recurring_override_api(payload: UpsertRecurringOverrideRequest, background_tasks: BackgroundTasks):
     effective_id = payload.id or uuid4()
     upsert_recurring_item_override(
         id=effective_id,
@@ -163,21 +225,33 @@ def upsert_recurring_override_api(payload: UpsertRecurringOverrideRequest):
         op = payload.op.value,
         scenarioId = payload.scenarioId
     )
+    background_tasks.add_task(request_projection_publish)
     return {"status": "ok", "id": str(effective_id)}
 
 @router.delete("/recurring-override/{item_id}", status_code=status.HTTP_202_ACCEPTED, summary="Delete recurring item")
-def delete_recurring_item_override_api(item_id: UUID):
+def delete_recurring_item_override_api(item_id: UUID, background_tasks: BackgroundTasks):
     deleted = delete_recurring_item_override(id=item_id)
+    background_tasks.add_task(request_projection_publish)
     return {"status": "deleted" if deleted else "not_found", "id": str(item_id)}
 
 #--- Single Items ---
 
 @router.get("/single")
-def get_single_items(accountId: Optional[str] = Query(None)):
-    return fetch_single_items(accountId)
+def get_single_items(
+    request: Request,
+    response: Response,
+    accountId: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=1000)):
+    not_modified = etag_response(request, response, "single_items")
+    if not_modified:
+        return not_modified
+    rows = fetch_single_items(accountId, decode_cursor(cursor, *ITEM_CURSOR), limit)
+    set_next_cursor(response, rows, limit, "date", "category", "description", "id")
+    return rows
 
 @router.post("/single", status_code=status.HTTP_202_ACCEPTED, summary="Upsert single item")
-def upsert_single_item_api(payload: UpsertSingleItemRequest):
+def upsert_single_item_api(payload: UpsertSingleItemRequest, background_tasks: BackgroundTasks):
     effective_id = payload.id or uuid4()
     upsert_single_item(
         id=effective_id,
@@ -189,20 +263,25 @@ def upsert_single_item_api(payload: UpsertSingleItemRequest):
         enabled=payload.enabled,
         account_id = payload.accountId
     )
+    background_tasks.add_task(request_projection_publish)
     return {"status": "ok", "id": str(effective_id)}
 
 @router.delete("/single/{item_id}", status_code=status.HTTP_202_ACCEPTED, summary="Delete single item")
-def delete_single_item_api(item_id: UUID):
+def delete_single_item_api(item_id: UUID, background_tasks: BackgroundTasks):
     deleted = delete_single_item(id=item_id)
+    background_tasks.add_task(request_projection_publish)
     return {"status": "deleted" if deleted else "not_found", "id": str(item_id)}
 # --- Single overrides
 
 @router.get("/single-override")
-def get_single_overrides(accountId: Optional[str] = Query(None), scenarioId: Optional[str] = Query(None)):
+def get_single_overrides(request: Request, response: Response, accountId: Optional[str] = Query(None), scenarioId: Optional[str] = Query(None)):
+    not_modified = etag_response(request, response, "single_overrides")
+    if not_modified:
+        return not_modified
     return fetch_single_items_overrides(accountId, scenarioId)
 
 @router.post("/single-override", status_code=status.HTTP_202_ACCEPTED, summary="Upsert single override")
-def upsert_single_override_api(payload: UpsertSingleOverrideRequest):
+def upsert_single_override_api(payload: UpsertSingleOverrideRequest, background_tasks: BackgroundTasks):
     effective_id = payload.id or uuid4()
     upsert_single_item_override(
         id=effective_id,
@@ -217,27 +296,58 @@ def upsert_single_override_api(payload: UpsertSingleOverrideRequest):
         op = payload.op.value,
         scenarioId = payload.scenarioId
     )
+    background_tasks.add_task(request_projection_publish)
     return {"status": "ok", "id": str(effective_id)}
 
 @router.delete("/single-override/{item_id}", status_code=status.HTTP_202_ACCEPTED, summary="Delete single item")
-def delete_single_item_override_api(item_id: UUID):
+def delete_single_item_override_api(item_id: UUID, background_tasks: BackgroundTasks):
     deleted = delete_single_item_override(id=item_id)
+    background_tasks.add_task(request_projection_publish)
     return {"status": "deleted" if deleted else "not_found", "id": str(item_id)}
 
 # --- Account movements
 
 @router.get("/account-movements")
-def get_account_movements(accountId: str = Query(...), until: Optional[date] = Query(None)):
-    return fetch_account_movements(accountId, until)
+def get_account_movements(
+    request: Request,
+    response: Response,
+    accountId: str = Query(...),
+    until: Optional[date] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=1000)):
+    # Without until the movements run to the horizon, which moves with the current date
+    not_modified = etag_response(request, response, "accounts", "recurring_items", "single_items", extra=(date.today(),))
+    if not_modified:
+        return not_modified
+    rows = fetch_account_movements(accountId, until, decode_cursor(cursor, *MOVEMENT_CURSOR), limit)
+    set_next_cursor(response, rows, limit, "date", "seq")
+    return rows
+
+# --- Combined items
+@router.get("/combined-items")
+def get_combined_items(
+    request: Request,
+    response: Response,
+    scenarioId: Optional[str] = Query(None),
+    accountId: Optional[str] = Query(None),
+    until: Optional[date] = Query(None)):
+    # Without until the items run to the horizon, which moves with the current date
+    not_modified = etag_response(request, response, *PROJECTION_TABLES, extra=(date.today(),))
+    if not_modified:
+        return not_modified
+    return combined_items(scenarioId, accountId, until)
 
 # --- Accounts
 
 @router.get("/accounts")
-def get_accounts():
+def get_accounts(request: Request, response: Response):
+    not_modified = etag_response(request, response, "accounts")
+    if not_modified:
+        return not_modified
     return fetch_accounts()
 
 @router.put("/accounts", status_code=status.HTTP_202_ACCEPTED, summary="Upsert account")
-def upsert_acount_api(payload: EditAccountRequest):
+def upsert_acount_api(payload: EditAccountRequest, background_tasks: BackgroundTasks):
     effective_id = payload.id or uuid4()
     upsert_account(
         id=effective_id,
@@ -248,19 +358,80 @@ def upsert_acount_api(payload: EditAccountRequest):
         type=payload.type,
         liquid=payload.liquid
     )
+    background_tasks.add_task(request_projection_publish)
     return {"status": "ok", "id": str(effective_id)}
 
 # --- Scenarios
 @router.get("/scenarios")
-def get_scenarios():
+def get_scenarios(request: Request, response: Response):
+    not_modified = etag_response(request, response, "scenarios")
+    if not_modified:
+        return not_modified
     return fetch_scenarios()
 
 @router.put("/scenarios", status_code=status.HTTP_202_ACCEPTED, summary="Upsert scenario")
-def upsert_scenario_api(payload: EditScenarioRequest):
+def upsert_scenario_api(payload: EditScenarioRequest, background_tasks: BackgroundTasks):
     effective_id = payload.id or uuid4()
     upsert_scenario(
         id=effective_id,
         description=payload.description,
         name=payload.name
     )
-    return {"status": "ok", "id": str(effective_id)}
\ No newline at end of file
+    background_tasks.add_task(request_projection_publish)
+    return {"status": "ok", "id": str(effective_id)}
+
+# --- Analytics
+@router.get("/analytics/categories", summary="Inflows and outflows per category, month and account")
+def get_category_analytics(
+    request: Request,
+    response: Response,
+    scenarioId: Optional[UUID] = Query(None),
+    dateFrom: Optional[date] = Query(None),
+    dateTo: Optional[date] = Query(None)):
+    # The actual/projected split moves with the current date
+    not_modified = etag_response(request, response, *PROJECTION_TABLES, extra=(date.today(),))
+    if not_modified:
+        return not_modified
+    rows = fetch_category_analytics(str(scenarioId) if scenarioId else None, dateFrom, dateTo)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="Unknown scenario")
+    return rows
+
+# --- Publishing
+async def publish_daily():
+    """Writes only republish on changes, so the horizon moving forward is published after midnight."""
+    while True:
+        midnight = datetime.combine(date.today() + timedelta(days=1), time())
+        await asyncio.sleep((midnight - datetime.now()).total_seconds())
+        try:
+            await run_in_threadpool(request_projection_publish)
+        except Exception as e:
+            print(f"Warning: daily projection publish failed: {e}")
+
+@router.post("/publish", summary="Publish projections to InfluxDB")
+def publish_projections_api():
+    points = publish_projections()
+    return {"status": "ok", "points": points}
+
+# --- Snapshots
+@router.get("/snapshot", summary="Export all cashflow data")
+def export_snapshot_api():
+    return Response(
+        content=export_snapshot(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="cashflow-{date.today().isoformat()}.zip"'})
+
+@router.post("/snapshot", summary="Replace all cashflow data with a snapshot")
+async def import_snapshot_api(request: Request, background_tasks: BackgroundTasks):
+    raw = await request.body()
+    try:
+        counts = await run_in_threadpool(import_snapshot, raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(request_projection_publish)
+    return {"status": "ok", "rows": counts}
+
+# --- Admin
+@router.get("/admin/explain", summary="Explain projection queries")
+def explain_projections_api(accountId: str = Query(...), scenario: Optional[str] = Query(None)):
+    return explain_projections(accountId, scenario)
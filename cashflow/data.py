@@ -1,6 +1,11 @@
 from __future__ import annotations
-from connections import get_cashflow_connection
+from connections import get_cashflow_connection, get_influx_client
+import versions
+import threading
+import io
+import zipfile
 from uuid import UUID
+import json
 import os
 from dataclasses import dataclass
 from datetime import date, timedelta
@@ -12,6 +17,8 @@ import psycopg2
 from typing import Optional, List, Dict, Any
 from datetime import date, datetime
 
+# Projections are expanded up to this many months ahead unless a caller asks for more
+DEFAULT_HORIZON_MONTHS = int(os.getenv("CASHFLOW_PROJECTION_HORIZON_MONTHS", "12"))
 
 def init():
     with get_cashflow_connection() as conn:
@@ -62,6 +69,8 @@ def init():
                 );
             """)
 
+            cur.execute(HORIZON_SQL, (DEFAULT_HORIZON_MONTHS,))
+
             cur.execute("""CREATE OR REPLACE VIEW recurring_items_projection AS
                     WITH bounds AS (
                     SELECT
@@ -75,8 +84,8 @@ def init():
                         r.kind,
                         r.amount,
                         r.account_id,
-                        /* stop at date_to, or 5 years from today if date_to is NULL */
-                        COALESCE(r.date_to, a.enddate) AS stop_date,
+                        /* stop at date_to or the account's end date, and never past the horizon */
+                        LEAST(COALESCE(r.date_to, a.enddate), projection_horizon()) AS stop_date,
                         /* build the interval step based on unit + every */
                         CASE r.unit
                         WHEN 'day'   THEN make_interval(days   => r.every)
@@ -123,7 +132,7 @@ def init():
             cur.execute("""CREATE OR REPLACE VIEW combined_items AS
                 SELECT date, category, description, amount, account_id, kind FROM recurring_items_projection
                     UNION
-                SELECT date, category, description, amount, account_id, kind FROM single_items WHERE enabled = TRUE;
+                SELECT date, category, description, amount, account_id, kind FROM single_items WHERE enabled = TRUE AND date <= projection_horizon();
             """)
 
             cur.execute("""CREATE OR REPLACE VIEW account_movements_by_account AS
@@ -214,7 +223,8 @@ def init():
                     r.kind,
                     r.balance,
                     a.type,
-                    a.liquid
+                    a.liquid,
+                    r.rn AS seq
                     FROM rec r
                     INNER JOIN accounts a
                     ON a.id = r.account_id
@@ -248,7 +258,10 @@ def init():
                 category TEXT,
                 description TEXT,
                 kind TEXT CHECK (kind IN ('absolute','percent')),
-                account_id UUID
+                account_id UUID,
+
+                -- last write; the latest replace of an item wins
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
                 );
             """)
 
@@ -269,11 +282,35 @@ def init():
                 category TEXT,
                 description TEXT,
                 kind TEXT CHECK (kind IN ('absolute','percent')),
-                account_id UUID
+                account_id UUID,
+
+                -- last write; the latest replace of an item wins
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
                 );
             """)
 
-            cur.execute("""CREATE OR REPLACE FUNCTION recurring_items_projection_for(scenario_name TEXT)
+            cur.execute("""
+                ALTER TABLE recurring_overrides ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp();
+                ALTER TABLE single_overrides ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp();
+            """)
+
+            cur.execute(INDEXES_SQL)
+            cur.execute(OVERLAY_SQL)
+            compile_overlay(cur)
+            cur.execute(SCENARIO_ITEMS_SQL)
+
+            # The horizon argument changed the signatures; without the old ones a call with
+            # only a scenario name isn't ambiguous
+            cur.execute("""
+                DROP FUNCTION IF EXISTS account_movements_by_account_for(TEXT);
+                DROP FUNCTION IF EXISTS combined_items_for(TEXT);
+                DROP FUNCTION IF EXISTS recurring_items_projection_for(TEXT);
+            """)
+
+            # STABLE lets the planner inline these into the calling query, so filters such as
+            # account_id reach the underlying tables instead of running over a Function Scan.
+            # `until` extends the projection past the default horizon.
+            cur.execute("""CREATE OR REPLACE FUNCTION recurring_items_projection_for(scenario_name TEXT, until DATE DEFAULT NULL)
                 RETURNS TABLE(
                 recurring_id UUID,
                 date DATE,
@@ -284,49 +321,11 @@ def init():
                 account_id UUID
                 )
                 LANGUAGE sql
+                STABLE
                 AS $$
                 WITH
-                s AS (SELECT id FROM scenarios WHERE name = scenario_name),
-
-                -- Base + REPLACE (immutable cols preserved)
-                base_modified AS (
-                SELECT
-                    r.id,
-                    COALESCE(ro.every, r.every) AS every,
-                    COALESCE(ro.unit,  r.unit)  AS unit,
-                    r.category,
-                    r.description,
-                    COALESCE(ro.date_from, r.date_from) AS date_from,
-                    COALESCE(ro.date_to,   r.date_to)   AS date_to,
-                    r.kind,
-                    COALESCE(ro.amount, r.amount) AS amount,
-                    r.account_id,
-                    COALESCE(ro.enabled, r.enabled) AS enabled
-                FROM recurring_items r
-                LEFT JOIN recurring_overrides ro
-                    ON ro.target_recurring_id = r.id
-                AND ro.op = 'replace'
-                AND ro.scenario_id = (SELECT id FROM s)
-                WHERE TRUE
-                ),
-
-                -- ADD rows (all fields required)
-                adds AS (
-                SELECT
-                    gen_random_uuid() AS id,
-                    ro.every, ro.unit, ro.category, ro.description,
-                    ro.date_from, ro.date_to, ro.kind, ro.amount, ro.account_id,
-                    COALESCE(ro.enabled, TRUE) AS enabled
-                FROM recurring_overrides ro
-                JOIN s ON s.id = ro.scenario_id
-                WHERE ro.op = 'add'
-                ),
-
-                -- unified source
                 recurring_source AS (
-                SELECT * FROM base_modified
-                UNION ALL
-                SELECT * FROM adds
+                SELECT * FROM scenario_recurring_items(scenario_name)
                 ),
 
                 bounds AS (
@@ -341,7 +340,7 @@ def init():
                     r.kind,
                     r.amount,
                     r.account_id,
-                    COALESCE(r.date_to, a.enddate) AS stop_date,
+                    LEAST(COALESCE(r.date_to, a.enddate), COALESCE(until, projection_horizon())) AS stop_date,
                     CASE r.unit
                     WHEN 'day'   THEN make_interval(days   => r.every)
                     WHEN 'week'  THEN make_interval(days   => 7 * r.every)
@@ -378,7 +377,7 @@ def init():
                 $$
             """)
 
-            cur.execute("""CREATE OR REPLACE FUNCTION combined_items_for(scenario_name TEXT)
+            cur.execute("""CREATE OR REPLACE FUNCTION combined_items_for(scenario_name TEXT, until DATE DEFAULT NULL)
                 RETURNS TABLE(
                 date DATE,
                 category TEXT,
@@ -388,55 +387,27 @@ def init():
                 kind TEXT
                 )
                 LANGUAGE sql
+                STABLE
                 AS $$
                 WITH
-                s AS (SELECT id FROM scenarios WHERE name = scenario_name),
-
-                base_modified AS (
-                SELECT
-                    si.id,
-                    COALESCE(so."date", si."date") AS "date",
-                    si.category,
-                    si.description,
-                    si.kind,
-                    COALESCE(so.amount, si.amount) AS amount,
-                    si.account_id,
-                    COALESCE(so.enabled, si.enabled) AS enabled
-                FROM single_items si
-                LEFT JOIN single_overrides so
-                    ON so.target_single_id = si.id
-                AND so.op = 'replace'
-                AND so.scenario_id = (SELECT id FROM s)
-                ),
-                adds AS (
-                SELECT
-                    gen_random_uuid() AS id,
-                    so."date", so.category, so.description, so.kind,
-                    so.amount, so.account_id,
-                    COALESCE(so.enabled, TRUE) AS enabled
-                FROM single_overrides so
-                JOIN s ON s.id = so.scenario_id
-                WHERE so.op = 'add'
-                ),
                 single_source AS (
-                SELECT id, "date", category, description, kind, amount, account_id, enabled FROM base_modified
-                UNION ALL
-                SELECT id, "date", category, description, kind, amount, account_id, enabled FROM adds
+                SELECT * FROM scenario_single_items(scenario_name)
                 )
                 SELECT date, category, description, amount, account_id, kind
                 FROM (
                 SELECT date, category, description, amount, account_id, kind
-                FROM recurring_items_projection_for(scenario_name)
+                FROM recurring_items_projection_for(scenario_name, until)
                 UNION ALL
                 SELECT "date", category, description, amount, account_id, kind
                 FROM single_source
                 WHERE enabled = TRUE
+                  AND "date" <= COALESCE(until, projection_horizon())
                 ) q
                 ORDER BY date;
                 $$
             """)
 
-            cur.execute("""CREATE OR REPLACE FUNCTION account_movements_by_account_for(scenario_name TEXT)
+            cur.execute("""CREATE OR REPLACE FUNCTION account_movements_by_account_for(scenario_name TEXT, until DATE DEFAULT NULL)
                 RETURNS TABLE(
                 date DATE,
                 category TEXT,
@@ -446,9 +417,11 @@ def init():
                 kind TEXT,
                 balance NUMERIC(14,2),
                 type TEXT,
-                liquid BOOLEAN
+                liquid BOOLEAN,
+                seq BIGINT
                 )
                 LANGUAGE sql
+                STABLE
                 AS $$
                 WITH RECURSIVE
                 anchors AS (
@@ -460,7 +433,7 @@ def init():
                 SELECT
                     ci.date, ci.category, ci.description, ci.account_id,
                     ci.amount::numeric, ci.kind::text, 1 AS ord
-                FROM combined_items_for(scenario_name) ci
+                FROM combined_items_for(scenario_name, until) ci
                 JOIN anchors an ON an.account_id = ci.account_id
                 WHERE ci.account_id IS NOT NULL
                     AND ci.date >= an.anchor_date
@@ -508,13 +481,209 @@ def init():
                 r.kind,
                 r.balance,
                 a.type,
-                a.liquid
+                a.liquid,
+                r.rn AS seq
                 FROM rec r
                 JOIN accounts a ON a.id = r.account_id
                 ORDER BY r.date, r.account_id, r.category, r.description;
                 $$
             """)
 
+# The end of the default projection, from CASHFLOW_PROJECTION_HORIZON_MONTHS
+HORIZON_SQL = """
+    CREATE OR REPLACE FUNCTION projection_horizon()
+    RETURNS DATE
+    LANGUAGE sql
+    STABLE
+    AS $$ SELECT (CURRENT_DATE + make_interval(months => %s))::date $$;
+"""
+
+INDEXES_SQL = """
+    -- Items are always filtered per account and walked in date order
+    CREATE INDEX IF NOT EXISTS ix_single_items_account_date
+        ON single_items (account_id, "date")
+        INCLUDE (category, description, kind, amount, enabled);
+
+    CREATE INDEX IF NOT EXISTS ix_recurring_items_account_date
+        ON recurring_items (account_id, date_from)
+        INCLUDE (every, unit, date_to, enabled);
+
+    -- Overrides are resolved per scenario and per target item
+    CREATE INDEX IF NOT EXISTS ix_recurring_overrides_scenario_target
+        ON recurring_overrides (scenario_id, op, target_recurring_id);
+
+    CREATE INDEX IF NOT EXISTS ix_recurring_overrides_target
+        ON recurring_overrides (target_recurring_id);
+
+    CREATE INDEX IF NOT EXISTS ix_recurring_overrides_account
+        ON recurring_overrides (account_id);
+
+    CREATE INDEX IF NOT EXISTS ix_single_overrides_scenario_target
+        ON single_overrides (scenario_id, op, target_single_id);
+
+    CREATE INDEX IF NOT EXISTS ix_single_overrides_target
+        ON single_overrides (target_single_id);
+
+    CREATE INDEX IF NOT EXISTS ix_single_overrides_account_date
+        ON single_overrides (account_id, "date");
+    """
+
+# The overrides of every scenario, compiled into one row per replaced item (the override
+# written last wins, NULL fields keep the base value) plus one per added item,
+# keyed by the override id so adds are stable across calls
+OVERLAY_SQL = """
+    CREATE TABLE IF NOT EXISTS recurring_overlay (
+        scenario_id UUID NOT NULL,
+        item_id     UUID NOT NULL,   -- the replaced recurring item, or the override for an add
+        op          TEXT NOT NULL,
+        every       INTEGER,
+        unit        TEXT,
+        category    TEXT,
+        description TEXT,
+        date_from   DATE,
+        date_to     DATE,
+        kind        TEXT,
+        amount      NUMERIC(14,2),
+        enabled     BOOLEAN,
+        account_id  UUID,
+        PRIMARY KEY (scenario_id, item_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS single_overlay (
+        scenario_id UUID NOT NULL,
+        item_id     UUID NOT NULL,   -- the replaced single item, or the override for an add
+        op          TEXT NOT NULL,
+        "date"      DATE,
+        category    TEXT,
+        description TEXT,
+        kind        TEXT,
+        amount      NUMERIC(14,2),
+        enabled     BOOLEAN,
+        account_id  UUID,
+        PRIMARY KEY (scenario_id, item_id)
+    );
+"""
+
+COMPILE_OVERLAY_SQL = """
+    DELETE FROM recurring_overlay WHERE %(all)s OR scenario_id = ANY(%(scenarios)s::uuid[]);
+    INSERT INTO recurring_overlay (scenario_id, item_id, op, every, unit, date_from, date_to, amount, enabled)
+    SELECT DISTINCT ON (scenario_id, target_recurring_id)
+        scenario_id, target_recurring_id, op, every, unit, date_from, date_to, amount, enabled
+    FROM recurring_overrides
+    WHERE op = 'replace' AND target_recurring_id IS NOT NULL
+      AND (%(all)s OR scenario_id = ANY(%(scenarios)s::uuid[]))
+    ORDER BY scenario_id, target_recurring_id, updated_at DESC, id DESC;
+    INSERT INTO recurring_overlay (scenario_id, item_id, op, every, unit, category, description, date_from, date_to, kind, amount, enabled, account_id)
+    SELECT scenario_id, id, op, every, unit, category, description, date_from, date_to, kind, amount, COALESCE(enabled, TRUE), account_id
+    FROM recurring_overrides
+    WHERE op = 'add'
+      AND (%(all)s OR scenario_id = ANY(%(scenarios)s::uuid[]));
+
+    DELETE FROM single_overlay WHERE %(all)s OR scenario_id = ANY(%(scenarios)s::uuid[]);
+    INSERT INTO single_overlay (scenario_id, item_id, op, "date", amount, enabled)
+    SELECT DISTINCT ON (scenario_id, target_single_id)
+        scenario_id, target_single_id, op, "date", amount, enabled
+    FROM single_overrides
+    WHERE op = 'replace' AND target_single_id IS NOT NULL
+      AND (%(all)s OR scenario_id = ANY(%(scenarios)s::uuid[]))
+    ORDER BY scenario_id, target_single_id, updated_at DESC, id DESC;
+    INSERT INTO single_overlay (scenario_id, item_id, op, "date", category, description, kind, amount, enabled, account_id)
+    SELECT scenario_id, id, op, "date", category, description, kind, amount, COALESCE(enabled, TRUE), account_id
+    FROM single_overrides
+    WHERE op = 'add'
+      AND (%(all)s OR scenario_id = ANY(%(scenarios)s::uuid[]));
+"""
+
+# The items of a scenario with its overlay applied, and the base items for a NULL scenario.
+# Everything that projects a scenario reads its items from here.
+SCENARIO_ITEMS_SQL = """
+    CREATE OR REPLACE FUNCTION scenario_recurring_items(scenario_name TEXT)
+    RETURNS TABLE(
+        id UUID, every INTEGER, unit TEXT, category TEXT, description TEXT,
+        date_from DATE, date_to DATE, kind TEXT, amount NUMERIC(14,2), account_id UUID, enabled BOOLEAN
+    )
+    LANGUAGE sql
+    STABLE
+    AS $$
+    SELECT
+        r.id,
+        COALESCE(o.every, r.every),
+        COALESCE(o.unit, r.unit),
+        r.category,
+        r.description,
+        COALESCE(o.date_from, r.date_from),
+        COALESCE(o.date_to, r.date_to),
+        r.kind,
+        COALESCE(o.amount, r.amount),
+        r.account_id,
+        COALESCE(o.enabled, r.enabled)
+    FROM recurring_items r
+    LEFT JOIN recurring_overlay o
+      ON o.scenario_id = (SELECT id FROM scenarios WHERE name = scenario_name)
+     AND o.item_id = r.id
+     AND o.op = 'replace'
+    UNION ALL
+    SELECT o.item_id, o.every, o.unit, o.category, o.description, o.date_from, o.date_to, o.kind, o.amount, o.account_id, o.enabled
+    FROM recurring_overlay o
+    WHERE o.scenario_id = (SELECT id FROM scenarios WHERE name = scenario_name) AND o.op = 'add'
+    $$;
+
+    CREATE OR REPLACE FUNCTION scenario_single_items(scenario_name TEXT)
+    RETURNS TABLE(
+        id UUID, "date" DATE, category TEXT, description TEXT, kind TEXT,
+        amount NUMERIC(14,2), account_id UUID, enabled BOOLEAN
+    )
+    LANGUAGE sql
+    STABLE
+    AS $$
+    SELECT
+        si.id,
+        COALESCE(o."date", si."date"),
+        si.category,
+        si.description,
+        si.kind,
+        COALESCE(o.amount, si.amount),
+        si.account_id,
+        COALESCE(o.enabled, si.enabled)
+    FROM single_items si
+    LEFT JOIN single_overlay o
+      ON o.scenario_id = (SELECT id FROM scenarios WHERE name = scenario_name)
+     AND o.item_id = si.id
+     AND o.op = 'replace'
+    UNION ALL
+    SELECT o.item_id, o."date", o.category, o.description, o.kind, o.amount, o.account_id, o.enabled
+    FROM single_overlay o
+    WHERE o.scenario_id = (SELECT id FROM scenarios WHERE name = scenario_name) AND o.op = 'add'
+    $$;
+"""
+
+def compile_overlay(cur, scenario_ids: Optional[Iterable[Any]] = None):
+    """Recompiles the overlay of the given scenarios (all of them for None), in the caller's transaction."""
+    scenarios = [] if scenario_ids is None else [str(s) for s in scenario_ids if s is not None]
+    if scenario_ids is not None and not scenarios:
+        return
+    cur.execute(COMPILE_OVERLAY_SQL, {"all": scenario_ids is None, "scenarios": scenarios})
+
+def fetch_scenario_items(scenario_id: Optional[str] = None, account_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """The recurring and single items of a scenario, overlay applied, in the shape of fetch_recurring_items/fetch_single_items."""
+    params = {"scenario": scenario_id, "account": account_id}
+    with get_cashflow_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT id, every, unit, category, description, date_from AS "dateFrom", date_to AS "dateTo",
+                       kind, amount, enabled, account_id AS "accountId"
+                FROM scenario_recurring_items((SELECT name FROM scenarios WHERE id = %(scenario)s::uuid))
+                WHERE %(account)s::uuid IS NULL OR account_id = %(account)s::uuid
+            """, params)
+            recurring = cur.fetchall()
+            cur.execute("""
+                SELECT id, "date", category, description, kind, amount, enabled, account_id AS "accountId"
+                FROM scenario_single_items((SELECT name FROM scenarios WHERE id = %(scenario)s::uuid))
+                WHERE %(account)s::uuid IS NULL OR account_id = %(account)s::uuid
+            """, params)
+            single = cur.fetchall()
+    return recurring, single
+
 # ---------- ACCOUNTS -----------------
 def upsert_account(
     id: UUID,
@@ -552,6 +721,7 @@ def upsert_account(
                 ),
             )
         conn.commit()
+    versions.bump("accounts")
 
 def fetch_accounts() -> List[Dict[str, Any]]:
     sql = """SELECT id, name, date, enddate, amount, type, liquid FROM accounts;"""
@@ -585,6 +755,7 @@ def upsert_scenario(
                 ),
             )
         conn.commit()
+    versions.bump("scenarios")
 
 def fetch_scenarios() -> List[Dict[str, Any]]:
     sql = """SELECT id, name, description FROM scenarios;"""
@@ -643,6 +814,7 @@ def upsert_recurring_item(
                 ),
             )
         conn.commit()
+    versions.bump("recurring_items")
 
 def upsert_recurring_item_override(
     id: UUID,
@@ -664,6 +836,9 @@ def upsert_recurring_item_override(
 
     with get_cashflow_connection() as conn:
         with conn.cursor() as cur:
+            # An update may move the override to another scenario; both overlays change
+            cur.execute("SELECT scenario_id FROM recurring_overrides WHERE id = %s", (str(id),))
+            scenarios = {row[0] for row in cur.fetchall()} | {str(scenarioId)}
             cur.execute(
                 """
                 INSERT INTO recurring_overrides (
@@ -683,7 +858,8 @@ def upsert_recurring_item_override(
                     kind = EXCLUDED.kind,
                     amount = EXCLUDED.amount,
                     enabled = EXCLUDED.enabled,
-                    account_id = EXCLUDED.account_id
+                    account_id = EXCLUDED.account_id,
+                    updated_at = clock_timestamp()
                 """,
                 (
                     str(id),
@@ -702,20 +878,31 @@ def upsert_recurring_item_override(
                     str(account_id)
                 ),
             )
+            compile_overlay(cur, scenarios)
         conn.commit()
+    versions.bump("recurring_overrides")
 
 def delete_recurring_item(id: UUID) -> bool:
     """Delete recurring item by ID. Returns True if something was deleted."""
     with get_cashflow_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM recurring_items WHERE id = %s", (str(id),))
-            cur.execute("DELETE FROM recurring_overrides WHERE target_recurring_id = %s", (str(id),))
+            cur.execute("DELETE FROM recurring_overrides WHERE target_recurring_id = %s RETURNING scenario_id", (str(id),))
             deleted = cur.rowcount > 0
+            compile_overlay(cur, {row[0] for row in cur.fetchall()})
         conn.commit()
+    versions.bump("recurring_items", "recurring_overrides")
 
     return deleted
 
-def fetch_recurring_items(account_id: Optional[str] = None) -> List[Dict[str, Any]]:
+def fetch_recurring_items(
+    account_id: Optional[str] = None,
+    after: Optional[Tuple[str, str, str, str]] = None,
+    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Lists recurring items ordered by (date_from, category, description, id).
+    `after` is the key of the last row of the previous page.
+    """
     sql = """
         SELECT
             id,
@@ -731,11 +918,21 @@ def fetch_recurring_items(account_id: Optional[str] = None) -> List[Dict[str, An
             account_id AS "accountId"
         FROM recurring_items
     """
-    params = []
+    where, params = [], []
     if account_id is not None:
-        sql += " WHERE account_id = %s"
+        where.append("account_id = %s")
         params.append(account_id)
 
+    if after is not None:
+        where.append("(date_from, category, description, id) > (%s::date, %s, %s, %s::uuid)")
+        params.extend(after)
+
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    sql += " ORDER BY date_from, category, description, id"
+    sql += paging_clause(limit, params)
+
     with get_cashflow_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(sql, params)
@@ -765,9 +962,11 @@ def delete_recurring_item_override(id: UUID) -> bool:
     """Delete recurring item by ID. Returns True if something was deleted."""
     with get_cashflow_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM recurring_overrides WHERE id = %s", (str(id),))
+            cur.execute("DELETE FROM recurring_overrides WHERE id = %s RETURNING scenario_id", (str(id),))
             deleted = cur.rowcount > 0
+            compile_overlay(cur, {row[0] for row in cur.fetchall()})
         conn.commit()
+    versions.bump("recurring_overrides")
 
     return deleted
 
@@ -802,6 +1001,7 @@ def upsert_single_item(
                 (str(id), date_, category, description, kind, amount, enabled, str(account_id)),
             )
         conn.commit()
+    versions.bump("single_items")
 
 def upsert_single_item_override(
     id: UUID,
@@ -821,6 +1021,8 @@ def upsert_single_item_override(
 
     with get_cashflow_connection() as conn:
         with conn.cursor() as cur:
+            cur.execute("SELECT scenario_id FROM single_overrides WHERE id = %s", (str(id),))
+            scenarios = {row[0] for row in cur.fetchall()} | {str(scenarioId)}
             cur.execute(
                 """
                 INSERT INTO single_overrides (
@@ -837,11 +1039,14 @@ def upsert_single_item_override(
                     account_id = EXCLUDED.account_id,
                     scenario_id = EXCLUDED.scenario_id,
                     op = EXCLUDED.op,
-                    target_single_id = EXCLUDED.target_single_id
+                    target_single_id = EXCLUDED.target_single_id,
+                    updated_at = clock_timestamp()
                 """,
                 (str(id), date_, category, description, kind, amount, enabled, str(account_id), str(scenarioId), op, target),
             )
+            compile_overlay(cur, scenarios)
         conn.commit()
+    versions.bump("single_overrides")
 
 def delete_single_item(id: UUID) -> bool:
     """Delete single item by ID. Returns True if something was deleted."""
@@ -850,12 +1055,21 @@ def delete_single_item(id: UUID) -> bool:
             cur.execute("DELETE FROM single_items WHERE id = %s", (str(id),))
             deleted = cur.rowcount > 0
 
-            cur.execute("DELETE FROM single_overrides WHERE target_single_id = %s", (str(id),))
+            cur.execute("DELETE FROM single_overrides WHERE target_single_id = %s RETURNING scenario_id", (str(id),))
+            compile_overlay(cur, {row[0] for row in cur.fetchall()})
         conn.commit()
+    versions.bump("single_items", "single_overrides")
 
     return deleted
 
-def fetch_single_items(account_id: Optional[str] = None) -> List[Dict[str, Any]]:
+def fetch_single_items(
+    account_id: Optional[str] = None,
+    after: Optional[Tuple[str, str, str, str]] = None,
+    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Lists single items ordered by (date, category, description, id).
+    `after` is the key of the last row of the previous page.
+    """
     sql = """
         SELECT
             id,
@@ -869,12 +1083,20 @@ def fetch_single_items(account_id: Optional[str] = None) -> List[Dict[str, Any]]
         FROM single_items
     """
 
-    params = []
+    where, params = [], []
     if account_id is not None:
-        sql += " WHERE account_id = %s"
+        where.append("account_id = %s")
         params.append(account_id)
 
-    sql += " ORDER BY date"
+    if after is not None:
+        where.append("(date, category, description, id) > (%s::date, %s, %s, %s::uuid)")
+        params.extend(after)
+
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    sql += " ORDER BY date, category, description, id"
+    sql += paging_clause(limit, params)
 
     with get_cashflow_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -915,26 +1137,42 @@ def delete_single_item_override(id: UUID) -> bool:
     """Delete single item by ID. Returns True if something was deleted."""
     with get_cashflow_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM single_overrides WHERE id = %s", (str(id),))
+            cur.execute("DELETE FROM single_overrides WHERE id = %s RETURNING scenario_id", (str(id),))
             deleted = cur.rowcount > 0
+            compile_overlay(cur, {row[0] for row in cur.fetchall()})
         conn.commit()
+    versions.bump("single_overrides")
 
     return deleted
 
 
 # ---------- Account movements ----------
-def fetch_account_movements(account_id: str, until: Optional[date] = None) -> List[Dict[str, Any]]:
+def fetch_account_movements(
+    account_id: str,
+    until: Optional[date] = None,
+    after: Optional[Tuple[str, int]] = None,
+    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Lists the movements of an account in balance order. `seq` is the position of the
+    movement in the running balance, so (date, seq) is the key for `after`. Without
+    `until` the movements stop at the default horizon.
+    """
 
-    sql = "SELECT date, category, description, account_id, amount, balance FROM account_movements_by_account"
+    sql = "SELECT date, category, description, account_id, amount, balance, seq FROM account_movements_by_account_for(NULL, %s)"
     where = ["account_id = %s"]
-    params: list = [account_id]
+    params: list = [until, account_id]
 
     if until is not None:
         where.append("date < %s")
         params.append(until)
 
+    if after is not None:
+        where.append("(date, seq) > (%s::date, %s::bigint)")
+        params.extend(after)
+
     sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY date"
+    sql += " ORDER BY date, seq"
+    sql += paging_clause(limit, params)
 
     with get_cashflow_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -953,6 +1191,345 @@ def fetch_account_movements(account_id: str, until: Optional[date] = None) -> Li
             cur.execute(sql)
             return cur.fetchall()
 
+# ---------- Analytics ----------
+# Every table a scenario-aware projection reads from
+PROJECTION_TABLES = ("accounts", "recurring_items", "single_items", "scenarios", "recurring_overrides", "single_overrides")
+
+CATEGORY_ANALYTICS_SQL = """
+    WITH items AS (
+        SELECT
+            m.category,
+            date_trunc('month', m.date)::date AS month,
+            m.account_id,
+            m.amount,
+            m.date <= CURRENT_DATE AS realized
+        FROM account_movements_by_account_for(%(scenario)s, %(date_to)s) m
+        WHERE m.category <> 'Opening Balance'
+          AND (%(date_from)s::date IS NULL OR m.date >= %(date_from)s::date)
+          AND (%(date_to)s::date IS NULL OR m.date <= %(date_to)s::date)
+    )
+    SELECT
+        CASE GROUPING(category, month, account_id)
+            WHEN 0 THEN 'category_month_account'
+            WHEN 1 THEN 'category_month'
+            WHEN 3 THEN 'category'
+            WHEN 5 THEN 'month'
+            ELSE 'total'
+        END AS level,
+        category,
+        month,
+        account_id AS "accountId",
+        ROUND(COALESCE(SUM(amount)  FILTER (WHERE realized AND amount > 0), 0), 2)     AS "actualInflow",
+        ROUND(COALESCE(SUM(-amount) FILTER (WHERE realized AND amount < 0), 0), 2)     AS "actualOutflow",
+        ROUND(COALESCE(SUM(amount)  FILTER (WHERE NOT realized AND amount > 0), 0), 2) AS "projectedInflow",
+        ROUND(COALESCE(SUM(-amount) FILTER (WHERE NOT realized AND amount < 0), 0), 2) AS "projectedOutflow"
+    FROM items
+    GROUP BY GROUPING SETS (
+        (category, month, account_id),
+        (category, month),
+        (category),
+        (month),
+        ()
+    )
+    ORDER BY GROUPING(category, month, account_id), category, month, account_id
+"""
+
+def fetch_category_analytics(
+    scenario_id: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Inflows/outflows per category x month x account with subtotals, computed in one
+    GROUPING SETS pass over the scenario's movements. Percent items are taken from the
+    movements so they count as the amount they add to the balance. Movements up to today
+    are reported as actual, later ones as projected. None when the scenario doesn't exist.
+    """
+    def query():
+        with get_cashflow_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                scenario_name = None
+                if scenario_id is not None:
+                    # Resolved up front: a sub-select argument would keep the function from being inlined
+                    cur.execute("SELECT name FROM scenarios WHERE id = %s", (str(scenario_id),))
+                    row = cur.fetchone()
+                    if row is None:
+                        return None
+                    scenario_name = row["name"]
+                cur.execute(CATEGORY_ANALYTICS_SQL, {"scenario": scenario_name, "date_from": date_from, "date_to": date_to})
+                return cur.fetchall()
+
+    key = ("category_analytics", scenario_id, date_from, date_to, date.today())
+    return versions.cached(key, PROJECTION_TABLES, query)
+
+# ---------- Influx publishing ----------
+# Grafana reads the projections from Influx instead of re-running the recursive views
+INFLUX_DATABASE = "cashflow"
+INFLUX_MEASUREMENT = "cashflow_projection"
+# Scenario series are tagged with the scenario's id (and its name, for display); the base
+# projection has no scenario and is tagged baseline=true, so no scenario name can collide with it
+BASELINE_TAG = "baseline"
+
+# The movements carry percent items as the amount they add, so a running sum of
+# the day totals (the opening row carries the opening balance) is the day-end balance.
+DAILY_PROJECTION_SQL = """
+    WITH daily AS (
+        SELECT
+            m.account_id,
+            m.date,
+            SUM(m.amount) AS total,
+            COALESCE(SUM(m.amount)  FILTER (WHERE m.category <> 'Opening Balance'), 0)                  AS movement,
+            COALESCE(SUM(m.amount)  FILTER (WHERE m.category <> 'Opening Balance' AND m.amount > 0), 0) AS inflow,
+            COALESCE(SUM(-m.amount) FILTER (WHERE m.category <> 'Opening Balance' AND m.amount < 0), 0) AS outflow
+        FROM account_movements_by_account_for(%s) m
+        GROUP BY m.account_id, m.date
+    )
+    SELECT
+        d.account_id,
+        a.name AS account_name,
+        d.date,
+        d.movement,
+        d.inflow,
+        d.outflow,
+        SUM(d.total) OVER (PARTITION BY d.account_id ORDER BY d.date) AS balance
+    FROM daily d
+    JOIN accounts a ON a.id = d.account_id
+    ORDER BY d.account_id, d.date
+"""
+
+_publish_lock = threading.Lock()
+_publish_requested = threading.Event()
+# The projection runs up to the horizon from today, so a publish is only current for the day it ran
+_published_version = None
+
+def publish_projections(batch_size: int = 5000) -> int:
+    """Rewrite the daily projection of every account for the base data and every scenario."""
+    global _published_version
+    version = versions.current(*PROJECTION_TABLES)
+
+    scenarios = [None] + fetch_scenarios()
+    client = get_influx_client(INFLUX_DATABASE)
+    client.create_database(INFLUX_DATABASE)
+    # Series written before the baseline tag existed carry neither tag
+    client.query(f'DELETE FROM "{INFLUX_MEASUREMENT}" WHERE "scenario_id" = \'\' AND "{BASELINE_TAG}" = \'\'')
+
+    written = 0
+    with get_cashflow_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            for scenario in scenarios:
+                cur.execute(DAILY_PROJECTION_SQL, (scenario and scenario["name"],))
+                rows = cur.fetchall()
+
+                if scenario is None:
+                    series_tags = {BASELINE_TAG: "true"}
+                    series_filter = f'"{BASELINE_TAG}" = \'true\''
+                else:
+                    series_tags = {"scenario_id": str(scenario["id"]), "scenario": scenario["name"]}
+                    series_filter = f'"scenario_id" = \'{scenario["id"]}\''
+
+                points = [{
+                    "measurement": INFLUX_MEASUREMENT,
+                    "tags": {
+                        "account_id": str(r["account_id"]),
+                        "account": r["account_name"],
+                        **series_tags,
+                    },
+                    "time": f"{r['date'].isoformat()}T00:00:00Z",
+                    "fields": {
+                        "balance": float(r["balance"]),
+                        "movement": float(r["movement"]),
+                        "inflow": float(r["inflow"]),
+                        "outflow": float(r["outflow"]),
+                    },
+                } for r in rows]
+
+                # Drop the old series first so removed items do not linger in the future
+                client.query(f'DELETE FROM "{INFLUX_MEASUREMENT}" WHERE {series_filter}')
+
+                if points:
+                    client.write_points(points, batch_size=batch_size)
+                written += len(points)
+
+    _published_version = (version, date.today())
+    print(f"Published {written} projection points for {len(scenarios)} scenarios")
+    return written
+
+def request_projection_publish():
+    """
+    Publishes after a write, and daily as the horizon moves. Requests arriving while a
+    publish runs are folded into one follow-up publish, and nothing is written when
+    neither the data nor the date changed.
+    """
+    _publish_requested.set()
+    while _publish_requested.is_set():
+        if not _publish_lock.acquire(blocking=False):
+            return  # the publish in progress picks the request up
+        try:
+            while _publish_requested.is_set():
+                _publish_requested.clear()
+                if (versions.current(*PROJECTION_TABLES), date.today()) == _published_version:
+                    continue
+                try:
+                    publish_projections()
+                except Exception as e:
+                    print(f"Warning: failed to publish projections: {e}")
+        finally:
+            _publish_lock.release()
+
+# ---------- Snapshots ----------
+# Parents before children so COPY never trips a foreign key
+SNAPSHOT_TABLES = {
+    "scenarios": ["id", "name", "description"],
+    "accounts": ["id", "name", "date", "enddate", "amount", "type", "liquid"],
+    "recurring_items": ["id", "every", "unit", "category", "description", "date_from", "date_to", "kind", "amount", "enabled", "account_id"],
+    "single_items": ["id", "date", "category", "description", "kind", "amount", "enabled", "account_id"],
+    "recurring_overrides": ["id", "scenario_id", "op", "target_recurring_id", "every", "unit", "amount", "date_from", "date_to", "enabled", "category", "description", "kind", "account_id", "updated_at"],
+    "single_overrides": ["id", "scenario_id", "op", "target_single_id", "date", "amount", "enabled", "category", "description", "kind", "account_id", "updated_at"],
+}
+SNAPSHOT_FORMAT = 2
+
+def export_snapshot() -> bytes:
+    """
+    Dumps every cashflow table with COPY ... (FORMAT binary) into one deflated zip,
+    next to a manifest with the column lists.
+    """
+    buffer = io.BytesIO()
+    manifest = {"format": SNAPSHOT_FORMAT, "tables": SNAPSHOT_TABLES}
+
+    with get_cashflow_connection() as conn:
+        with conn.cursor() as cur, zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            # One snapshot of all tables, even while writes come in
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            for table, columns in SNAPSHOT_TABLES.items():
+                data = io.BytesIO()
+                cur.copy_expert(
+                    sql.SQL("COPY (SELECT {} FROM {}) TO STDOUT WITH (FORMAT binary)").format(
+                        sql.SQL(", ").join(map(sql.Identifier, columns)), sql.Identifier(table)),
+                    data)
+                archive.writestr(f"{table}.bin", data.getvalue())
+            archive.writestr("manifest.json", json.dumps(manifest))
+
+    return buffer.getvalue()
+
+def import_snapshot(raw: bytes) -> Dict[str, int]:
+    """Replaces all cashflow data with a snapshot in a single transaction."""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(raw))
+        manifest = json.loads(archive.read("manifest.json"))
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise ValueError(f"Not a cashflow snapshot: {e}")
+
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("tables") != SNAPSHOT_TABLES:
+        raise ValueError("Snapshot was taken from a different schema")
+
+    counts = {}
+    with get_cashflow_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("TRUNCATE {}").format(sql.SQL(", ").join(map(sql.Identifier, SNAPSHOT_TABLES))))
+            for table, columns in SNAPSHOT_TABLES.items():
+                cur.copy_expert(
+                    sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT binary)").format(
+                        sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))),
+                    io.BytesIO(archive.read(f"{table}.bin")))
+                counts[table] = cur.rowcount
+            compile_overlay(cur)
+        conn.commit()
+    versions.bump(*SNAPSHOT_TABLES)
+
+    return counts
+
+# ---------- Query plans ----------
+PROJECTION_QUERIES = {
+    "recurring_items_projection": """
+        SELECT * FROM recurring_items_projection WHERE account_id = %(account_id)s
+    """,
+    "recurring_items_projection_for": """
+        SELECT * FROM recurring_items_projection_for(%(scenario)s) WHERE account_id = %(account_id)s
+    """,
+    "combined_items_for": """
+        SELECT * FROM combined_items_for(%(scenario)s) WHERE account_id = %(account_id)s
+    """,
+    "account_movements_by_account": """
+        SELECT * FROM account_movements_by_account WHERE account_id = %(account_id)s
+    """,
+    "account_movements_by_account_for": """
+        SELECT * FROM account_movements_by_account_for(%(scenario)s) WHERE account_id = %(account_id)s
+    """,
+}
+
+# Flag plan nodes whose row estimate is off by more than this factor
+MISESTIMATE_FACTOR = 10
+
+def explain_projections(account_id: str, scenario_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Run EXPLAIN (ANALYZE, BUFFERS) on every projection query and summarize the plans."""
+    params = {"account_id": account_id, "scenario": scenario_name}
+    reports = []
+
+    with get_cashflow_connection() as conn:
+        with conn.cursor() as cur:
+            for name, query in PROJECTION_QUERIES.items():
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                reports.append(_summarize_plan(name, plan[0]))
+        # EXPLAIN ANALYZE executes the statements; never keep anything around
+        conn.rollback()
+
+    return reports
+
+def _summarize_plan(name: str, explained: Dict[str, Any]) -> Dict[str, Any]:
+    scans, seq_scans, misestimates, function_scans = [], [], [], []
+
+    def walk(node: Dict[str, Any]):
+        node_type = node.get("Node Type")
+        planned = node.get("Plan Rows", 0)
+        actual = node.get("Actual Rows", 0) * max(node.get("Actual Loops", 1), 1)
+        relation = node.get("Relation Name") or node.get("Function Name") or node.get("CTE Name")
+
+        entry = {
+            "node": node_type,
+            "relation": relation,
+            "planRows": planned,
+            "actualRows": actual,
+            "sharedHitBlocks": node.get("Shared Hit Blocks", 0),
+            "sharedReadBlocks": node.get("Shared Read Blocks", 0),
+        }
+
+        # Every table read, so what the inlined functions touch shows up as well
+        if node.get("Relation Name"):
+            scans.append(entry)
+        if node_type == "Seq Scan":
+            seq_scans.append(entry)
+        elif node_type == "Function Scan":
+            function_scans.append(entry)
+
+        low, high = sorted((max(planned, 1), max(actual, 1)))
+        if high / low > MISESTIMATE_FACTOR:
+            misestimates.append(entry)
+
+        for child in node.get("Plans", []):
+            walk(child)
+
+    root = explained["Plan"]
+    walk(root)
+
+    return {
+        "query": name,
+        "planningTimeMs": explained.get("Planning Time"),
+        "executionTimeMs": explained.get("Execution Time"),
+        "rows": root.get("Actual Rows"),
+        "scans": scans,
+        "seqScans": seq_scans,
+        "functionScans": function_scans,
+        "misestimates": misestimates,
+    }
+
+def paging_clause(limit: Optional[int], params: list) -> str:
+    if limit is None:
+        return ""
+    params.append(limit)
+    return " LIMIT %s"
+
 def build_where_clause(conditions):
     parts, params = [], []
     for field, (op, value) in conditions.items():
@@ -0,0 +1,113 @@
+from __future__ import annotations
+import threading
+from bisect import bisect_right
+from datetime import date
+from typing import Any, Dict, List, Optional
+from dateutil.relativedelta import relativedelta
+import versions
+from cashflow.data import fetch_accounts, fetch_scenario_items, PROJECTION_TABLES, DEFAULT_HORIZON_MONTHS
+
+# ---------- Combined items ----------
+STEPS = {
+    "day": lambda n: relativedelta(days=n),
+    "week": lambda n: relativedelta(days=7 * n),
+    "month": lambda n: relativedelta(months=n),
+    "year": lambda n: relativedelta(years=n),
+}
+
+class Projection:
+    """
+    The combined items of one scenario/account, expanded up to `horizon`. Every recurring
+    item remembers its next occurrence, so extending the horizon only generates the new
+    segment and appends it instead of starting over from the anchor dates.
+    """
+    def __init__(self, version, recurring: List[Dict[str, Any]], single: List[Dict[str, Any]], end_dates: Dict[str, date]):
+        self.version = version
+        self.horizon: Optional[date] = None
+        self.items: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+        # [item, next occurrence, step, last possible occurrence]
+        self._recurring = []
+        for r in recurring:
+            account_end = end_dates.get(str(r["accountId"]))
+            if not r["enabled"] or account_end is None or r["unit"] not in STEPS or r["every"] <= 0:
+                continue
+            self._recurring.append([r, r["dateFrom"], STEPS[r["unit"]](r["every"]), r["dateTo"] or account_end])
+
+        self._single = sorted((si for si in single if si["enabled"]), key=lambda si: si["date"])
+        self._next_single = 0
+
+    def until(self, until: date) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self.horizon is None or until > self.horizon:
+                self._extend(until)
+            return self.items[:bisect_right(self.items, until, key=lambda i: i["date"])]
+
+    def _extend(self, to: date):
+        # Everything generated here lies after the current horizon, so the
+        # sorted segment can be appended as-is
+        segment = []
+        for state in self._recurring:
+            item, current, step, stop = state
+            last = min(stop, to)
+            while current <= last:
+                segment.append(_combined_row(item, current))
+                # Same stepping as generate_series: each step is added to the previous occurrence
+                current = current + step
+            state[1] = current
+
+        while self._next_single < len(self._single) and self._single[self._next_single]["date"] <= to:
+            si = self._single[self._next_single]
+            segment.append(_combined_row(si, si["date"]))
+            self._next_single += 1
+
+        segment.sort(key=_sort_key)
+        self.items.extend(segment)
+        self.horizon = to
+
+_projections: Dict[tuple, Projection] = {}
+_projections_lock = threading.Lock()
+
+def get_projection(scenario_id: Optional[str] = None, account_id: Optional[str] = None) -> Projection:
+    version = versions.current(*PROJECTION_TABLES)
+    key = (scenario_id, account_id)
+
+    with _projections_lock:
+        projection = _projections.get(key)
+    if projection is not None and projection.version == version:
+        return projection
+
+    # The scenario's compiled overlay is applied in SQL, the same one the *_for functions read
+    recurring, single = fetch_scenario_items(scenario_id, account_id)
+    end_dates = {str(a["id"]): a["enddate"] for a in fetch_accounts()}
+    projection = Projection(version, recurring, single, end_dates)
+
+    with _projections_lock:
+        _projections[key] = projection
+    return projection
+
+def default_horizon() -> date:
+    return date.today() + relativedelta(months=DEFAULT_HORIZON_MONTHS)
+
+def combined_items(scenario_id: Optional[str] = None, account_id: Optional[str] = None, until: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    The expanded recurring items plus the single items of every account, with the
+    scenario's overlay applied, up to `until` (the default horizon when omitted).
+    """
+    projection = get_projection(scenario_id, account_id)
+    return projection.until(until or default_horizon())
+
+def _combined_row(item: Dict[str, Any], occurrence: date) -> Dict[str, Any]:
+    return {
+        "id": item["id"],
+        "date": occurrence,
+        "category": item["category"],
+        "description": item["description"],
+        "amount": item["amount"],
+        "accountId": item["accountId"],
+        "kind": item["kind"],
+    }
+
+def _sort_key(item: Dict[str, Any]):
+    return (item["date"], item["category"], item["description"], str(item["id"]))
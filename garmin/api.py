@@ -1,12 +1,11 @@
 # garmin_to_postgres.py
-import os
 import json
-from garminconnect import Garmin
 from datetime import datetime, timedelta
 from typing import Optional
 from dateutil.parser import parse as parse_date
 from fastapi import APIRouter, Request
-from garmin.data import insert_activity, insert_exercise
+from garmin.data import fetch_known_activity_ids, insert_activities
+from garmin.session import garmin_call
 
 router = APIRouter()
 
@@ -16,8 +15,6 @@ def fetchData(
     startDate: Optional[str] = None, 
     endDate:  Optional[str] = None
     ):
-    TOKEN_DIR = os.getenv("TOKEN_STORE_PATH", "/app/token-store")
-
     if not startDate:
         startDate = (datetime.utcnow() - timedelta(days=3)).isoformat()
 
@@ -29,78 +26,81 @@ def fetchData(
 
     print(f"Fetching activities from {start} to {end}")
 
-    garmin = Garmin()
-    garmin.login(TOKEN_DIR)
-    print("Logged into Garmin")
-
-    activities = garmin.get_activities_by_date(start.isoformat(), end.isoformat())
+    activities = garmin_call(lambda garmin: garmin.get_activities_by_date(start.isoformat(), end.isoformat()))
     print(f"Fetched {len(activities)} activities")
 
+    known = fetch_known_activity_ids(str(a["activityId"]) for a in activities)
+    new_activities = []
+    strength_sets = []
     for a in activities:
         aid = str(a["activityId"])
+        if aid in known:
+            continue
+        known.add(aid)
+
         activityType = a.get("activityType", {}).get("typeKey")
         print(f"Inserting activity {aid} of type {activityType}")
-
-        inserted = insert_activity(
-            aid, 
-                a.get("startTimeLocal"),
-                a.get("activityType", {}).get("typeKey"),
-                a.get("duration"),
-                a.get("distance"),
-                a.get("calories"),
-                a.get("averageHR"),
-                a.get("maxHR"),
-                a.get("steps"),
-                a.get("elevationGain"),
-                json.dumps(a)
-        )
-
-        if not inserted:
-            continue
+        new_activities.append((
+            aid,
+            a.get("startTimeLocal"),
+            activityType,
+            a.get("duration"),
+            a.get("distance"),
+            a.get("calories"),
+            a.get("averageHR"),
+            a.get("maxHR"),
+            a.get("steps"),
+            a.get("elevationGain"),
+            json.dumps(a),
+        ))
 
         if activityType == "strength_training":
             try:
                 print(f"Fetching strength sets for activity {aid}")
-                detail = garmin.get_activity_exercise_sets(aid)
-                sets = detail.get("exerciseSets", [])
-                for idx, s in enumerate(sets):
-                    if s.get("setType") != "ACTIVE":
-                        continue
-
-                    best_exercise = max(s.get("exercises", []), key=lambda e: e.get("probability", 0), default={})
-                    category = best_exercise.get("category")
-                    name = best_exercise.get("name") or best_exercise.get("category")
-
-                    start_time = parse_date(s.get("startTime"))
-                    duration = s.get("duration", 0.0)
-                    end_time = start_time + timedelta(seconds=duration)
-                    reps = s.get("repetitionCount") or 0
-                    weight = s.get("weight")
-
-                    # Derived effort time (in minutes)
-                    rep_tempo = 3.0  # average seconds per rep
-                    effort_time_min = (reps * rep_tempo) / 60.0
-
-                    # MET scaling by reps
-                    met = max(4.0, 6.5 - 0.1 * reps)
-
-                    # Scaled kcal output (per kg bodyweight)
-                    per_kg_kcal = effort_time_min * met * 0.0175
-
-                    # Get rest duration from the next REST set
-                    rest_duration = None
-                    for next_set in sets[idx+1:]:
-                        if next_set.get("setType") == "REST":
-                            rest_duration = next_set.get("duration")
-                            break
-
-                    exercise_id = f"{aid}-{idx}"
-                    insert_exercise(aid, exercise_id, category, name, duration, reps, weight, start_time, end_time, rest_duration, per_kg_kcal)
+                detail = garmin_call(lambda garmin: garmin.get_activity_exercise_sets(aid))
+                strength_sets.extend(parse_strength_sets(aid, detail.get("exerciseSets", [])))
             except Exception as e:
-                print(f"Warning: failed to fetch or insert strength sets for {aid}: {e}")
-    
-    print("Done inserting new activities and strength sets.")
+                print(f"Warning: failed to fetch strength sets for {aid}: {e}")
+
+    # One transaction for the whole batch instead of a connection per activity and set
+    insert_activities(new_activities, strength_sets)
+    print(f"Inserted {len(new_activities)} new activities and {len(strength_sets)} strength sets.")
+
+    return {"status": "ok", "activities": len(new_activities), "strength_sets": len(strength_sets)}
+
+def parse_strength_sets(aid, sets):
+    rows = []
+    for idx, s in enumerate(sets):
+        if s.get("setType") != "ACTIVE":
+            continue
+
+        best_exercise = max(s.get("exercises", []), key=lambda e: e.get("probability", 0), default={})
+        category = best_exercise.get("category")
+        name = best_exercise.get("name") or best_exercise.get("category")
+
+        start_time = parse_date(s.get("startTime"))
+        duration = s.get("duration", 0.0)
+        end_time = start_time + timedelta(seconds=duration)
+        reps = s.get("repetitionCount") or 0
+        weight = s.get("weight")
+
+        # Derived effort time (in minutes)
+        rep_tempo = 3.0  # average seconds per rep
+        effort_time_min = (reps * rep_tempo) / 60.0
+
+        # MET scaling by reps
+        met = max(4.0, 6.5 - 0.1 * reps)
+
+        # Scaled kcal output (per kg bodyweight)
+        per_kg_kcal = effort_time_min * met * 0.0175
 
-    return {"status": "ok"}
+        # Get rest duration from the next REST set
+        rest_duration = None
+        for next_set in sets[idx+1:]:
+            if next_set.get("setType") == "REST":
+                rest_duration = next_set.get("duration")
+                break
 
-    
+        exercise_id = f"{aid}-{idx}"
+        rows.append((aid, exercise_id, category, name, duration, reps, weight, start_time, end_time, rest_duration, per_kg_kcal))
+    return rows
@@ -1,4 +1,9 @@
 from connections import get_fitness_connection
+from workouts.data import init_records, refresh_records, refresh_all_records, GARMIN_SOURCE
+from workouts.training_load import refresh_training_load
+from workouts.reconcile import refresh_activity_links
+from psycopg2 import extras
+import versions
 
 def init():
     with get_fitness_connection() as conn:
@@ -47,33 +52,48 @@ def init():
                 )
                 """)
 
-def insert_activity(id, startTime, activityType,duration, distance, calories, averageHR, maxHR, steps, elevationGain, metadata):
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_garmin_strength_exercises_name ON garmin_strength_exercises (exercise_name)")
+
+            init_records(cur)
+            refresh_all_records(cur, GARMIN_SOURCE)
+
+ACTIVITY_COLUMNS = (
+    "activity_id", "start_time", "activity_type", "duration_seconds", "distance_meters",
+    "calories", "average_hr", "max_hr", "steps", "elevation_gain", "json_payload")
+STRENGTH_SET_COLUMNS = (
+    "activity_id", "exercise_id", "category", "exercise_name", "duration", "repetitions",
+    "weight", "start_time", "end_time", "rest_duration", "per_kg_kcal")
+
+def fetch_known_activity_ids(activity_ids):
     with get_fitness_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM garmin_activities WHERE activity_id = %s", (id,))
-            if cur.fetchone():
-                return False  # already exists
+            cur.execute("SELECT activity_id FROM garmin_activities WHERE activity_id = ANY(%s)", (list(activity_ids),))
+            return {row[0] for row in cur.fetchall()}
 
-            cur.execute(
-            """
-            INSERT INTO garmin_activities (
-                activity_id, start_time, activity_type, duration_seconds,
-                distance_meters, calories, average_hr, max_hr, steps,
-                elevation_gain, json_payload
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (id, startTime, activityType,duration, distance, calories, averageHR, maxHR, steps, elevationGain, metadata))
-            return True
-
-def insert_exercise(aid, exercise_id, category, name, duration, reps, weight, start_time, end_time, rest_duration, per_kg_kcal):
+def insert_activities(activities, strength_sets):
+    """
+    Inserts new activities and their strength sets (tuples in ACTIVITY_COLUMNS /
+    STRENGTH_SET_COLUMNS order) in one transaction, then refreshes the records,
+    training load and set links they touch once for the whole batch.
+    """
+    if not activities and not strength_sets:
+        return
     with get_fitness_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO garmin_strength_exercises (
-                    activity_id, exercise_id, category, exercise_name, duration,
-                    repetitions, weight, start_time, end_time, rest_duration, per_kg_kcal
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            extras.execute_values(cur, f"""
+                INSERT INTO garmin_activities ({", ".join(ACTIVITY_COLUMNS)}) VALUES %s
+                ON CONFLICT (activity_id) DO NOTHING
+            """, activities, page_size=500)
+            extras.execute_values(cur, f"""
+                INSERT INTO garmin_strength_exercises ({", ".join(STRENGTH_SET_COLUMNS)}) VALUES %s
                 ON CONFLICT (activity_id, exercise_id) DO NOTHING
-                """,
-                (aid, exercise_id, category, name, duration, reps, weight, start_time, end_time, rest_duration, per_kg_kcal))
\ No newline at end of file
+            """, strength_sets, page_size=1000)
+
+            activity_ids = [a[0] for a in activities] + [s[0] for s in strength_sets]
+            cur.execute("SELECT MIN(start_time)::date FROM garmin_activities WHERE activity_id = ANY(%s)", (activity_ids,))
+            since = cur.fetchone()[0]
+            if since:
+                refresh_training_load(cur, since)
+            refresh_records(cur, GARMIN_SOURCE, {(s[3], "") for s in strength_sets if s[3]})
+            refresh_activity_links(cur, activity_ids)
+    versions.bump("garmin_strength_exercises")
@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+from garminconnect import Garmin, GarminConnectAuthenticationError
+
+TOKEN_DIR = os.getenv("TOKEN_STORE_PATH", "/app/token-store")
+
+# The tokens refresh themselves, so logging in again is only needed when Garmin rejects
+# them; this caps how long one session is trusted regardless
+MAX_SESSION_AGE = float(os.getenv("GARMIN_SESSION_MAX_AGE_HOURS", "24")) * 3600
+
+_session = None
+_logged_in_at = 0.0
+_lock = threading.Lock()
+
+def get_garmin() -> Garmin:
+    """
+    The process-wide Garmin client. Requests arriving while a login is underway wait
+    for it and share the result instead of logging in themselves.
+    """
+    global _session, _logged_in_at
+    with _lock:
+        if _session is None or time.monotonic() - _logged_in_at > MAX_SESSION_AGE:
+            garmin = Garmin()
+            garmin.login(TOKEN_DIR)
+            print("Logged into Garmin")
+            _session, _logged_in_at = garmin, time.monotonic()
+        return _session
+
+def invalidate(garmin: Garmin):
+    # Only drops the session the caller failed with; a newer one is kept
+    global _session
+    with _lock:
+        if _session is garmin:
+            _session = None
+
+def garmin_call(fn):
+    """Runs fn(garmin), logging in again once if Garmin rejects the current session."""
+    garmin = get_garmin()
+    try:
+        return fn(garmin)
+    except GarminConnectAuthenticationError:
+        print("Garmin session rejected, logging in again")
+        invalidate(garmin)
+        return fn(get_garmin())
@@ -3,16 +3,20 @@ from garmin.data import init as init_garmin
 from workouts.data import init as init_workouts
 from withings.data import init as init_withings
 from cashflow.data import init as init_cashflow
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from workouts.workouts import router as workouts_router
 from workouts.exercises import router as exercises_router
 from workouts.sync import router as sync_router
+from workouts.analytics import router as workouts_analytics_router
+from workouts.records import router as records_router
 from nutrition.api import router as nutrition_router
 from tanita.api import router as tanita_router
 from garmin.api import router as garmin_router
 from withings.api import router as withings_router
-from cashflow.api import router as cashflow_router
+from cashflow.api import router as cashflow_router, publish_daily
 
 
 print("Initializing tables")
@@ -21,8 +25,14 @@ init_workouts()
 init_withings()
 init_cashflow()
 
+@asynccontextmanager
+async def lifespan(app):
+    daily_publish = asyncio.create_task(publish_daily())
+    yield
+    daily_publish.cancel()
+
 print("Starting API")
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,12 +40,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 ''' Workouts '''
 app.include_router(workouts_router, prefix="/workouts/workouts", tags=["workouts"])
 app.include_router(exercises_router, prefix="/workouts/exercises", tags=["exercises"])
 app.include_router(sync_router, prefix="/workouts", tags=["sync"])
+app.include_router(workouts_analytics_router, prefix="/workouts/analytics", tags=["workouts analytics"])
+app.include_router(records_router, prefix="/workouts/records", tags=["records"])
 
 ''' Nutrition '''
 app.include_router(nutrition_router, prefix="/nutrition", tags=["nutrition"])
@@ -0,0 +1,28 @@
+import psycopg2
+import pytest
+import connections
+
+# These tests run against a real Postgres (POSTGRES_CON, as for the app) and are
+# skipped when there is none to talk to
+
+def _connect(get_connection):
+    if not connections.POSTGRES_CON:
+        pytest.skip("POSTGRES_CON is not set")
+    try:
+        get_connection().close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres is not reachable: {e}")
+
+@pytest.fixture(scope="session")
+def cashflow_db():
+    _connect(connections.get_cashflow_connection)
+    from cashflow import data
+    data.init()
+    return connections.get_cashflow_connection
+
+@pytest.fixture(scope="session")
+def fitness_db():
+    _connect(connections.get_fitness_connection)
+    from workouts import data
+    data.init()
+    return connections.get_fitness_connection
@@ -0,0 +1,47 @@
+from datetime import date
+from decimal import Decimal
+from workouts.attribution import AttributionMatrix
+
+# Paths as in the seeded muscle_taxonomy
+ARMS = "upper.arms"
+BICEPS = "upper.arms.biceps_brachii"
+LONG_HEAD = "upper.arms.biceps_brachii.long_head"
+BRACHIORADIALIS = "upper.arms.brachioradialis"
+
+def matrix():
+    return AttributionMatrix(
+        version=(),
+        rows={
+            ("Bicep Curl", ""): [(BICEPS, Decimal("1"))],
+            ("Hammer Curl", ""): [(LONG_HEAD, Decimal("0.5")), (BRACHIORADIALIS, Decimal("0.5"))],
+        },
+        nodes={
+            ARMS: ("Arms", 2),
+            BICEPS: ("Biceps Brachii", 3),
+            LONG_HEAD: ("Biceps Long Head", 4),
+            BRACHIORADIALIS: ("Brachioradialis", 3),
+        },
+        descendants={
+            ARMS: frozenset({ARMS, BICEPS, LONG_HEAD, BRACHIORADIALIS}),
+            BICEPS: frozenset({BICEPS, LONG_HEAD}),
+        },
+        muscles={LONG_HEAD: BICEPS},
+    )
+
+TOTALS = [
+    {"d": date(2026, 1, 5), "name": "Bicep Curl", "variation": "", "sets": 3, "volume": Decimal("300")},
+    {"d": date(2026, 1, 5), "name": "Hammer Curl", "variation": "", "sets": 4, "volume": Decimal("400")},
+]
+
+def credit(metric, level, path=None):
+    m = matrix()
+    return {target: value for (_, target), value in m.apply(TOTALS, metric, m.columns(metric, level, path), "day").items()}
+
+def test_muscle_sets_include_their_submuscles():
+    # As vw_muscle_daily_sets: the hammer curl's long-head set credit counts for the biceps
+    assert credit("sets", "muscle") == {BICEPS: Decimal("5"), BRACHIORADIALIS: Decimal("2")}
+    assert credit("sets", "muscle", BICEPS) == {BICEPS: Decimal("5")}
+
+def test_other_levels_count_only_their_own_targets():
+    assert credit("volume", "muscle") == {BICEPS: Decimal("300"), BRACHIORADIALIS: Decimal("200")}
+    assert credit("sets", "submuscle") == {LONG_HEAD: Decimal("2")}
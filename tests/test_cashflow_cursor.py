@@ -0,0 +1,26 @@
+from datetime import date
+from uuid import uuid4
+import pytest
+from fastapi import HTTPException
+from cashflow.api import decode_cursor, encode_cursor, ITEM_CURSOR, MOVEMENT_CURSOR
+
+def test_cursors_round_trip():
+    item_id = str(uuid4())
+    assert decode_cursor(encode_cursor([date(2026, 1, 31), "Rent", "Flat", item_id]), *ITEM_CURSOR) == (date(2026, 1, 31), "Rent", "Flat", item_id)
+    assert decode_cursor(encode_cursor([date(2026, 1, 31), 7]), *MOVEMENT_CURSOR) == (date(2026, 1, 31), 7)
+
+@pytest.mark.parametrize("values", [
+    ["2026-13-01", "Rent", "Flat", str(uuid4())],
+    ["2026-01-31", "Rent", "Flat", "not-a-uuid"],
+    ["2026-01-31", "Rent", "Flat"],
+])
+def test_tampered_item_cursors_are_rejected(values):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(encode_cursor(values), *ITEM_CURSOR)
+    assert e.value.status_code == 400
+
+@pytest.mark.parametrize("cursor", [encode_cursor(["2026-01-31", "seven"]), "%%%", "bm90IGpzb24"])
+def test_tampered_movement_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, *MOVEMENT_CURSOR)
+    assert e.value.status_code == 400
@@ -0,0 +1,39 @@
+from datetime import date
+from uuid import uuid4
+import pytest
+from cashflow.data import explain_projections
+
+@pytest.fixture
+def account(cashflow_db):
+    account_id, scenario = str(uuid4()), f"explain-{uuid4()}"
+    with cashflow_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO accounts (id, name, date, enddate, amount, type, liquid) VALUES (%s, 'Explain', %s, %s, 100, 'bank', true)",
+                        (account_id, date(2025, 1, 1), date(2026, 1, 1)))
+            cur.execute("INSERT INTO recurring_items (every, unit, category, description, date_from, kind, amount, enabled, account_id) VALUES (1, 'month', 'Rent', 'Flat', %s, 'absolute', -10, true, %s)",
+                        (date(2025, 1, 1), account_id))
+            cur.execute("INSERT INTO single_items (id, date, category, description, kind, amount, enabled, account_id) VALUES (%s, %s, 'Gift', 'Once', 'absolute', 5, true, %s)",
+                        (str(uuid4()), date(2025, 3, 1), account_id))
+            cur.execute("INSERT INTO scenarios (name) VALUES (%s)", (scenario,))
+        conn.commit()
+
+    yield account_id, scenario
+
+    with cashflow_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM recurring_items WHERE account_id = %s", (account_id,))
+            cur.execute("DELETE FROM single_items WHERE account_id = %s", (account_id,))
+            cur.execute("DELETE FROM accounts WHERE id = %s", (account_id,))
+            cur.execute("DELETE FROM scenarios WHERE name = %s", (scenario,))
+        conn.commit()
+
+def test_scenario_functions_are_inlined(account):
+    reports = {r["query"]: r for r in explain_projections(*account)}
+
+    for name in ("recurring_items_projection_for", "combined_items_for", "account_movements_by_account_for"):
+        report = reports[name]
+        # The plan shows the tables the function reads, not an opaque call to it
+        assert not any(s["relation"].endswith("_for") for s in report["functionScans"]), name
+        assert "recurring_items" in {s["relation"] for s in report["scans"]}, name
+
+    assert "single_items" in {s["relation"] for s in reports["combined_items_for"]["scans"]}
@@ -0,0 +1,44 @@
+from datetime import date
+from uuid import uuid4
+import pytest
+from cashflow import data
+from cashflow.projection import combined_items, default_horizon, DEFAULT_HORIZON_MONTHS
+
+@pytest.fixture
+def account(cashflow_db):
+    account_id = str(uuid4())
+    today = date.today()
+    data.upsert_account(id=account_id, name="Horizon", date=today, endDate=date(2099, 12, 31), amount=100, type="bank", liquid=True)
+    data.upsert_recurring_item(id=uuid4(), every=1, unit="month", category="Salary", description="Monthly", dateFrom=today,
+                               dateTo=None, kind="absolute", amount=10, enabled=True, account_id=account_id)
+
+    yield account_id
+
+    with cashflow_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM recurring_items WHERE account_id = %s", (account_id,))
+            cur.execute("DELETE FROM accounts WHERE id = %s", (account_id,))
+        conn.commit()
+
+def salary_dates(cur, query, *params):
+    cur.execute(query, params)
+    return sorted(row[0] for row in cur.fetchall())
+
+def test_projections_stop_at_the_horizon_unless_asked_for_more(cashflow_db, account):
+    horizon = default_horizon()
+    far = date(date.today().year + 5, 1, 1)
+    python = [i["date"] for i in combined_items(None, account)]
+
+    with cashflow_db() as conn:
+        with conn.cursor() as cur:
+            view = salary_dates(cur, "SELECT date FROM combined_items WHERE account_id = %s", account)
+            function = salary_dates(cur, "SELECT date FROM combined_items_for(NULL) WHERE account_id = %s", account)
+            extended = salary_dates(cur, "SELECT date FROM combined_items_for(NULL, %s) WHERE account_id = %s", far, account)
+
+    assert view == function == python
+    # One occurrence a month from today up to and including the horizon
+    assert python[-1] <= horizon and len(python) == DEFAULT_HORIZON_MONTHS + 1
+    assert extended[:len(python)] == python and extended[-1] <= far and len(extended) > len(python)
+
+    movements = data.fetch_account_movements(account, far)
+    assert [m["date"] for m in movements if m["category"] == "Salary"] == [d for d in extended if d < far]
@@ -0,0 +1,63 @@
+from datetime import date
+from uuid import uuid4
+import pytest
+from cashflow import data
+from cashflow.projection import combined_items
+
+@pytest.fixture
+def scenario(cashflow_db):
+    account_id, scenario_id = str(uuid4()), str(uuid4())
+    name = f"overlay-{scenario_id}"
+    data.upsert_account(id=account_id, name="Overlay", date=date(2025, 1, 1), endDate=date(2025, 6, 30), amount=100, type="bank", liquid=True)
+    data.upsert_scenario(id=scenario_id, name=name, description="")
+
+    yield account_id, scenario_id, name
+
+    with cashflow_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM recurring_overrides WHERE scenario_id = %s", (scenario_id,))
+            data.compile_overlay(cur, [scenario_id])
+            cur.execute("DELETE FROM recurring_items WHERE account_id = %s", (account_id,))
+            cur.execute("DELETE FROM accounts WHERE id = %s", (account_id,))
+            cur.execute("DELETE FROM scenarios WHERE id = %s", (scenario_id,))
+        conn.commit()
+
+def override(scenario_id, account_id, id, target, amount, op="replace", **fields):
+    values = dict(every=None, unit=None, category=None, description=None, dateFrom=None, dateTo=None, kind=None, enabled=None)
+    values.update(fields)
+    data.upsert_recurring_item_override(id=id, scenarioId=scenario_id, op=op, targetRecurringId=target, amount=amount, account_id=account_id, **values)
+
+def test_sql_and_python_projections_share_the_overlay(cashflow_db, scenario):
+    account_id, scenario_id, name = scenario
+    rent = str(uuid4())
+    data.upsert_recurring_item(id=rent, every=1, unit="month", category="Rent", description="Flat", dateFrom=date(2025, 1, 1),
+                               dateTo=None, kind="absolute", amount=-10, enabled=True, account_id=account_id)
+    # Two replaces of one item: the one written last wins whatever its id, without duplicating the item
+    low, high = sorted([uuid4(), uuid4()])
+    override(scenario_id, account_id, high, rent, -20)
+    override(scenario_id, account_id, low, rent, -30)
+    override(scenario_id, account_id, uuid4(), None, -5, op="add", every=2, unit="month", category="Gym", description="Fee",
+             dateFrom=date(2025, 2, 1), kind="absolute")
+
+    with cashflow_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT date, category, amount FROM combined_items_for(%s) WHERE account_id = %s", (name, account_id))
+            from_sql = sorted(cur.fetchall())
+    from_python = sorted((i["date"], i["category"], i["amount"]) for i in combined_items(scenario_id, account_id, date(2025, 6, 30)))
+
+    assert [r for r in from_sql if r[1] == "Rent"] == [(date(2025, m, 1), "Rent", -30) for m in range(1, 7)]
+    assert [r[0] for r in from_sql if r[1] == "Gym"] == [date(2025, 2, 1), date(2025, 4, 1), date(2025, 6, 1)]
+    assert from_python == from_sql
+
+    # Updating the other replace makes it the latest
+    override(scenario_id, account_id, high, rent, -40)
+    with cashflow_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT amount FROM combined_items_for(%s) WHERE category = 'Rent' AND account_id = %s", (name, account_id))
+            assert cur.fetchall() == [(-40,)]
+
+    data.delete_recurring_item_override(high)
+    with cashflow_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT amount FROM combined_items_for(%s) WHERE category = 'Rent' AND account_id = %s", (name, account_id))
+            assert cur.fetchall() == [(-30,)]
@@ -0,0 +1,47 @@
+from uuid import uuid4
+import pytest
+from workouts import data
+from workouts.normalize import fetch_unmapped_exercises
+
+@pytest.fixture
+def workout(fitness_db):
+    notion_id = f"normalize-test-{uuid4().hex}"
+    data.bulk_upsert([(notion_id, "2026-03-02", None, None, None)], [])
+    yield notion_id
+    data.delete_workout(notion_id)
+
+def exercise(workout_id, name, variation, notion_id, weight=60):
+    return (workout_id, name, variation, 3, 8, weight, None, None, None, notion_id)
+
+def stored(fitness_db, workout_id):
+    with fitness_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT notion_id, name, variation FROM exercises WHERE workout_notion_id = %s ORDER BY notion_id", (workout_id,))
+            return cur.fetchall()
+
+def test_flat_and_incline_bench_in_one_batch_keep_both_rows(fitness_db, workout):
+    data.bulk_upsert([], [
+        exercise(workout, "Incline Bench Press", None, f"{workout}-incline"),
+        exercise(workout, "Bench Press", "Flat", f"{workout}-flat"),
+    ])
+
+    # Both resolve to Bench Press; the one already named so keeps it, the other its own name
+    assert stored(fitness_db, workout) == [
+        (f"{workout}-flat", "Bench Press", "Flat"),
+        (f"{workout}-incline", "Incline Bench Press", None),
+    ]
+    unmapped = {(u["name"], u["variation"]): u for u in fetch_unmapped_exercises("2026-03-02", "2026-03-02")}
+    assert unmapped[("Incline Bench Press", "")]["suggestion"]["name"] == "Bench Press"
+
+def test_a_later_exercise_does_not_overwrite_a_stored_one(fitness_db, workout):
+    data.bulk_upsert([], [exercise(workout, "Bench Press", "Flat", f"{workout}-flat")])
+    data.create_exercise(*exercise(workout, "Incline Bench Press", None, f"{workout}-incline", weight=50))
+    data.bulk_upsert([], [exercise(workout, "Incline Bench Press", None, f"{workout}-incline", weight=55)])
+
+    assert stored(fitness_db, workout) == [
+        (f"{workout}-flat", "Bench Press", "Flat"),
+        (f"{workout}-incline", "Incline Bench Press", None),
+    ]
+
+    data.delete_exercise(workout, "Incline Bench Press")
+    assert stored(fitness_db, workout) == [(f"{workout}-flat", "Bench Press", "Flat")]
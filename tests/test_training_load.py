@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+import pytest
+from workouts.training_load import refresh_training_load, TOTAL_SERIES
+
+def add_workout(cur, day, weight):
+    notion_id = f"training-load-test-{day.isoformat()}"
+    cur.execute("INSERT INTO workouts (notion_id, date) VALUES (%s, %s)", (notion_id, day))
+    cur.execute("INSERT INTO exercises (workout_notion_id, name, sets, reps, weight, notion_id) VALUES (%s, 'Deadlift', 1, 1, %s, %s)",
+                (notion_id, weight, notion_id + "-x"))
+
+def stored(cur):
+    cur.execute("SELECT series, d, load, acute, chronic, acwr, monotony, strain FROM training_load_daily ORDER BY series, d")
+    return cur.fetchall()
+
+def test_incremental_refresh_after_a_gap_matches_a_full_rebuild(fitness_db):
+    today = date.today()
+    with fitness_db() as conn:
+        with conn.cursor() as cur:
+            for i in range(60):
+                add_workout(cur, today - timedelta(days=70 - i), 100)
+            refresh_training_load(cur)
+            # The previous refresh ran six days ago, so nothing is stored after that
+            cur.execute("DELETE FROM training_load_daily WHERE d > %s", (today - timedelta(days=6),))
+
+            add_workout(cur, today - timedelta(days=2), 100)
+            refresh_training_load(cur, today - timedelta(days=2))
+            incremental = stored(cur)
+            refresh_training_load(cur)
+            full = stored(cur)
+            conn.rollback()
+
+    assert [row[:2] for row in incremental] == [row[:2] for row in full]
+    for got, expected in zip(incremental, full):
+        assert got[2:] == pytest.approx(expected[2:], rel=1e-9), got[:2]
+
+    volume = {row[1]: row for row in full if row[0] == TOTAL_SERIES}
+    assert volume[today][4] > 50  # the chronic load carried over the gap instead of restarting at 0
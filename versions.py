@@ -0,0 +1,65 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import Request, Response
+
+# Change versions are kept in-process and bumped by every write in the data modules.
+# A restart starts a new epoch so ETags handed out by a previous process never match.
+_EPOCH = str(time.time_ns())
+_versions: Dict[str, int] = {}
+_lock = threading.Lock()
+
+# Results memoized per data version; a bump makes older entries unreachable and they age out
+CACHE_SIZE = 256
+_cache: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+def bump(*tables: str):
+    with _lock:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+
+def current(*tables: str) -> Tuple[int, ...]:
+    return tuple(_versions.get(table, 0) for table in tables)
+
+def cached(key: Hashable, tables: Tuple[str, ...], producer: Callable[[], Any]) -> Any:
+    versioned_key = (key, current(*tables))
+    with _lock:
+        if versioned_key in _cache:
+            _cache.move_to_end(versioned_key)
+            return _cache[versioned_key]
+
+    value = producer()
+
+    with _lock:
+        _cache[versioned_key] = value
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+def etag(tables: Tuple[str, ...], *extra) -> str:
+    parts = [_EPOCH]
+    parts += [f"{table}={version}" for table, version in zip(tables, current(*tables))]
+    parts += [str(e) for e in extra]
+    return '"' + hashlib.sha1("|".join(parts).encode()).hexdigest() + '"'
+
+def etag_response(request: Request, response: Response, *tables: str, extra: Tuple = ()) -> Optional[Response]:
+    """
+    Returns a 304 response when the client already has the current version,
+    otherwise stamps the ETag on the outgoing response and returns None.
+    """
+    tag = etag(tables, request.url.path, request.url.query, *extra)
+    matches = _if_none_match(request)
+    if tag in matches or "*" in matches:
+        return Response(status_code=304, headers={"ETag": tag})
+
+    response.headers["ETag"] = tag
+    return None
+
+def _if_none_match(request: Request) -> set:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return set()
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    return {t.strip().removeprefix("W/") for t in header.split(",")}
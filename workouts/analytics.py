@@ -0,0 +1,61 @@
+from datetime import date
+from enum import Enum
+from typing import Optional
+from fastapi import APIRouter, Request, Response, Query
+from versions import etag_response
+from workouts.data import TRAINING_TABLES, SEED_TABLES
+from workouts.attribution import training_analytics
+from workouts.reconcile import fetch_merged_sets, SET_LINK_TABLES
+
+router = APIRouter()
+
+class TaxonomyLevel(str, Enum):
+    region = "region"
+    group = "group"
+    muscle = "muscle"
+    submuscle = "submuscle"
+
+class Bucket(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+def analytics_response(metric, request, response, level, path, dateFrom, dateTo, bucket):
+    not_modified = etag_response(request, response, *TRAINING_TABLES, *SEED_TABLES)
+    if not_modified:
+        return not_modified
+    return training_analytics(metric, level.value, path, dateFrom, dateTo, bucket.value)
+
+@router.get("/volume", summary="Training volume per taxonomy node and bucket")
+def get_volume(
+    request: Request,
+    response: Response,
+    level: TaxonomyLevel = Query(TaxonomyLevel.muscle),
+    path: Optional[str] = Query(None, description="Only nodes under this taxonomy path, e.g. upper.chest"),
+    dateFrom: Optional[date] = Query(None),
+    dateTo: Optional[date] = Query(None),
+    bucket: Bucket = Query(Bucket.week)):
+    return analytics_response("volume", request, response, level, path, dateFrom, dateTo, bucket)
+
+@router.get("/sets", summary="Sets per taxonomy node and bucket")
+def get_sets(
+    request: Request,
+    response: Response,
+    level: TaxonomyLevel = Query(TaxonomyLevel.muscle),
+    path: Optional[str] = Query(None, description="Only nodes under this taxonomy path, e.g. upper.chest"),
+    dateFrom: Optional[date] = Query(None),
+    dateTo: Optional[date] = Query(None),
+    bucket: Bucket = Query(Bucket.week)):
+    return analytics_response("sets", request, response, level, path, dateFrom, dateTo, bucket)
+
+@router.get("/strength-sets", summary="Garmin sets linked to their Notion exercise: Garmin timing and rest with Notion weight and RIR")
+def get_strength_sets(
+    request: Request,
+    response: Response,
+    dateFrom: Optional[date] = Query(None),
+    dateTo: Optional[date] = Query(None),
+    exercise: Optional[str] = Query(None)):
+    not_modified = etag_response(request, response, *SET_LINK_TABLES)
+    if not_modified:
+        return not_modified
+    return fetch_merged_sets(dateFrom, dateTo, exercise)
\ No newline at end of file
@@ -0,0 +1,112 @@
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, FrozenSet, List, Mapping, Tuple
+import versions
+from workouts.data import (
+    fetch_attribution_seeds, fetch_exercise_daily_totals,
+    TRAINING_TABLES, SEED_TABLES )
+
+TAXONOMY_LEVELS = {"region": 1, "group": 2, "muscle": 3, "submuscle": 4}
+
+BUCKETS = {
+    "day": lambda d: d,
+    "week": lambda d: d - timedelta(days=d.weekday()),
+    "month": lambda d: d.replace(day=1),
+}
+
+@dataclass
+class AttributionMatrix:
+    """
+    exercise_target_map as a sparse exercise x taxonomy-node matrix, with the taxonomy
+    alongside it, so analytics never join the seed tables per request.
+    """
+    version: Tuple[int, ...]
+    # (name, variation) -> [(target path, contribution)]
+    rows: Dict[Tuple[str, str], List[Tuple[str, Decimal]]]
+    # path -> (name, level)
+    nodes: Dict[str, Tuple[str, int]]
+    # path -> every path under it, itself included
+    descendants: Dict[str, FrozenSet[str]]
+    # submuscle path -> the muscle it belongs to
+    muscles: Dict[str, str]
+
+    def columns(self, metric: str, level: str, path: str = None) -> Mapping[str, str]:
+        """
+        The targets credited at `level`, optionally only under `path`, each mapped to the
+        node it counts for. Like vw_muscle_daily_sets, sets mapped to a submuscle also
+        count for its muscle; everywhere else only the targets at the level itself count.
+        """
+        level_number = TAXONOMY_LEVELS[level]
+        candidates = self.descendants.get(path, frozenset()) if path else self.nodes
+        columns = {p: p for p in candidates if self.nodes[p][1] == level_number}
+        if metric == "sets" and level == "muscle":
+            columns.update({sub: muscle for sub, muscle in self.muscles.items() if muscle in columns})
+        return columns
+
+    def apply(self, totals, metric: str, columns: Mapping[str, str], bucket: str) -> Dict[Tuple, Decimal]:
+        """Multiplies per-exercise daily totals by the matrix, credited through `columns`."""
+        to_bucket = BUCKETS[bucket]
+        result = defaultdict(Decimal)
+        for total in totals:
+            value = total[metric]
+            for target, contribution in self.rows.get((total["name"], total["variation"]), ()):
+                column = columns.get(target)
+                if column is not None:
+                    result[(to_bucket(total["d"]), column)] += value * contribution
+        return result
+
+_matrix: AttributionMatrix = None
+_lock = threading.Lock()
+
+def load_matrix() -> AttributionMatrix:
+    version = versions.current(*SEED_TABLES)
+    contributions, taxonomy, closure = fetch_attribution_seeds()
+
+    rows = defaultdict(list)
+    for name, variation, target, contribution in contributions:
+        rows[(name, variation)].append((target, contribution))
+
+    nodes = {path: (name, level) for path, name, level in taxonomy}
+    descendants = defaultdict(set)
+    muscles = {}
+    for ancestor, descendant in closure:
+        descendants[ancestor].add(descendant)
+        if nodes[ancestor][1] == TAXONOMY_LEVELS["muscle"] and nodes[descendant][1] == TAXONOMY_LEVELS["submuscle"]:
+            muscles[descendant] = ancestor
+
+    return AttributionMatrix(
+        version=version,
+        rows=dict(rows),
+        nodes=nodes,
+        descendants={path: frozenset(paths) for path, paths in descendants.items()},
+        muscles=muscles,
+    )
+
+def get_matrix() -> AttributionMatrix:
+    global _matrix
+    with _lock:
+        if _matrix is None or _matrix.version != versions.current(*SEED_TABLES):
+            _matrix = load_matrix()
+        return _matrix
+
+def training_analytics(metric, level, path=None, date_from=None, date_to=None, bucket="day"):
+    """
+    Volume or set credit per taxonomy node at `level` (region/group/muscle/submuscle),
+    optionally limited to the nodes under `path`, summed per day, week or month.
+    Like the vw_*_daily_* views, each level counts the targets mapped at that level,
+    except that muscle sets also include the sets mapped to its submuscles.
+    """
+    def compute():
+        matrix = get_matrix()
+        totals = fetch_exercise_daily_totals(date_from, date_to)
+        result = matrix.apply(totals, metric, matrix.columns(metric, level, path), bucket)
+        return [
+            {"bucket": b, "path": target, "name": matrix.nodes[target][0], "value": value}
+            for (b, target), value in sorted(result.items())
+        ]
+
+    key = ("training_analytics", metric, level, path, date_from, date_to, bucket)
+    return versions.cached(key, TRAINING_TABLES + SEED_TABLES, compute)
@@ -0,0 +1,89 @@
+import asyncio
+import os
+from fastapi.concurrency import run_in_threadpool
+import workouts.notion as notion
+import workouts.data as data
+import workouts.page_cache as page_cache
+
+# Editing a page in Notion fires a burst of webhooks; everything arriving within this
+# window is collapsed into one fetch per page and a single bulk write. The writes (and the
+# derived tables they refresh) run in the threadpool so the event loop keeps taking webhooks.
+COALESCE_SECONDS = float(os.getenv("NOTION_WEBHOOK_COALESCE_SECONDS", "5"))
+
+WORKOUT = "workout"
+EXERCISE = "exercise"
+
+_pending = {}
+_events = 0
+_flush_task = None
+# Every write from Notion holds this: a flush that starts while another is still writing waits
+# for it, so a page's writes land in order, and webhooks arriving during a sync or resync stay
+# queued until it is done instead of being overwritten by it
+write_lock = asyncio.Lock()
+
+def enqueue(kind, page_id):
+    global _events, _flush_task
+    _pending[page_id.replace("-", "")] = kind
+    _events += 1
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_later())
+
+def discard(page_id):
+    _pending.pop(page_id.replace("-", ""), None)
+
+async def _flush_later():
+    global _flush_task
+    await asyncio.sleep(COALESCE_SECONDS)
+    _flush_task = None
+    try:
+        await flush()
+    except Exception as e:
+        # The next /workouts/sync picks up whatever this batch missed
+        print(f"Failed to flush Notion webhooks: {e}")
+
+async def flush():
+    async with write_lock:
+        await _flush()
+
+async def _flush():
+    global _pending, _events
+    batch, events = _pending, _events
+    _pending, _events = {}, 0
+    if not batch:
+        return
+
+    page_ids = list(batch)
+    pages = await notion.fetch_pages(page_ids)
+
+    live = []
+    for page_id, page in zip(page_ids, pages):
+        if notion.is_page_deleted(page):
+            if batch[page_id] == WORKOUT:
+                await run_in_threadpool(data.delete_workout, page_id)
+            else:
+                await run_in_threadpool(data.delete_exercise_by_notion_id, page_id)
+        elif page.get("object") == "error":
+            print(f"Skipping Notion page {page_id}: {page.get('message')}")
+        else:
+            live.append(page)
+
+    # Notion also fires for edits that leave the properties as they were
+    (changed,), hits = await run_in_threadpool(page_cache.drop_unchanged, live)
+
+    workouts = []
+    exercises = []
+    unlinked = []
+    for page in changed:
+        page_id = page_cache.page_id(page)
+        if batch[page_id] == WORKOUT:
+            workouts.append(notion.parse_workout(page))
+        else:
+            parsed = notion.parse_exercise(page)
+            if parsed:
+                exercises.append((*parsed, page_id))
+            else:
+                unlinked.append(page_id)
+
+    await run_in_threadpool(data.bulk_upsert, workouts, exercises, unlinked, changed)
+    page_cache.cache_report("webhooks", hits, len(live))
+    print(f"Flushed {len(batch)} Notion pages for {events} webhook events")
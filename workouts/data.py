@@ -1,6 +1,17 @@
 
+import io
 from datetime import datetime
+from psycopg2.extras import RealDictCursor
 from connections import get_fitness_connection
+import versions
+from workouts.training_load import init_training_load, refresh_training_load
+from workouts.page_cache import init_page_cache, store_pages, evict_pages, clear_page_cache
+from workouts.normalize import init_aliases, renormalize_exercises, normalize_exercises, get_index, CATALOG_TABLES
+from workouts.reconcile import init_set_links, refresh_set_links
+
+TRAINING_TABLES = ("workouts", "exercises")
+RECORD_TABLES = ("workouts", "exercises", "garmin_strength_exercises")
+SEED_TABLES = ("muscle_taxonomy", "exercise_target_map")
 
 def init():
     with get_fitness_connection() as conn:
@@ -31,17 +42,55 @@ def init():
                 );
             """)
 
+            cur.execute("""
+                ALTER TABLE exercises ADD COLUMN IF NOT EXISTS notion_id TEXT;
+                CREATE INDEX IF NOT EXISTS ix_exercises_notion_id ON exercises (notion_id);
+                CREATE INDEX IF NOT EXISTS ix_exercises_name_variation ON exercises (name, COALESCE(variation,''));
+            """)
+
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS notion_sync_state (
+                    database_id TEXT PRIMARY KEY,
+                    last_edited_time TIMESTAMPTZ NOT NULL
+                );
+            """)
+
+            init_page_cache(cur)
+
             cur.execute(TAXONOMY_SQL)
 
+            cur.execute(TAXONOMY_CLOSURE_SQL)
+
             cur.execute(EXERCISES_META)
 
             cur.execute(TAXONOMY_MAPPING_SQL)
 
+            init_aliases(cur)
+            renormalize_exercises(cur)
+
+            cur.execute(TARGET_ROLLUP_SQL)
+
+            init_records(cur)
+
+            # The seeds above may have changed the mapping, so the rollup is rebuilt in full
+            refresh_all_rollups(cur)
+            refresh_all_records(cur, NOTION_SOURCE)
+
             cur.execute(TAXONOMY_ROLLUP_VIEWS)
 
+            # Reads the views above and garmin_activities, so it runs after both exist
+            init_training_load(cur)
+            refresh_training_load(cur)
+
+            # Links Garmin sets to these exercises, so it also needs the garmin tables
+            init_set_links(cur)
+            refresh_set_links(cur)
+    versions.bump(*SEED_TABLES, *CATALOG_TABLES, "garmin_exercise_map")
+
 def create_workout(notion_id, date, personal_notes, coach_notes, metadata):
     with get_fitness_connection() as conn:
         with conn.cursor() as cur:
+            rows = touched_rows(cur, [notion_id])
             cur.execute("""
                 INSERT INTO workouts (notion_id, date, personal_notes, coach_notes, metadata)
                 VALUES (%s, %s, %s, %s, %s)
@@ -51,19 +100,37 @@ def create_workout(notion_id, date, personal_notes, coach_notes, metadata):
                   coach_notes = EXCLUDED.coach_notes,
                   metadata = EXCLUDED.metadata
             """, (notion_id, date, personal_notes, coach_notes, metadata))
+            evict_pages(cur, [notion_id])
+            refresh_derived(cur, rows | touched_rows(cur, [notion_id]))
+    versions.bump("workouts")
 
 def delete_workout(notion_id):
     with get_fitness_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM exercises WHERE workout_notion_id = %s", (notion_id,))
+            rows = touched_rows(cur, [notion_id])
+            cur.execute("DELETE FROM exercises WHERE workout_notion_id = %s RETURNING notion_id", (notion_id,))
+            evict_pages(cur, [notion_id] + [row[0] for row in cur.fetchall()])
             cur.execute("DELETE FROM workouts WHERE notion_id = %s", (notion_id,))
+            refresh_derived(cur, rows)
+    versions.bump(*TRAINING_TABLES)
 
-def create_exercise(workout_notion_id, name, variation, sets, reps, weight, rir, notes, metadata):
+def create_exercise(workout_notion_id, name, variation, sets, reps, weight, rir, notes, metadata, notion_id=None):
     with get_fitness_connection() as conn:
         with conn.cursor() as cur:
+            exercise = (workout_notion_id, name, variation, sets, reps, weight, rir, notes, metadata, notion_id)
+            name, variation = normalize_exercises([exercise], cur)[0][1:3]
+            exercise_ids = [notion_id] if notion_id else []
+            rows = touched_rows(cur, [workout_notion_id], exercise_ids)
+            if notion_id:
+                # The page may have been moved to another workout or renamed since the last sync
+                cur.execute("""
+                    DELETE FROM exercises
+                    WHERE notion_id = %s AND (workout_notion_id, name) <> (%s, %s)
+                """, (notion_id, workout_notion_id, name))
+
             cur.execute("""
-                INSERT INTO exercises (workout_notion_id, name, variation, sets, reps, weight, rir, notes, metadata)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO exercises (workout_notion_id, name, variation, sets, reps, weight, rir, notes, metadata, notion_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 ON CONFLICT (workout_notion_id, name) DO UPDATE SET
                   variation = EXCLUDED.variation,
                   sets = EXCLUDED.sets,
@@ -71,21 +138,452 @@ def create_exercise(workout_notion_id, name, variation, sets, reps, weight, rir,
                   weight = EXCLUDED.weight,
                   rir = EXCLUDED.rir,
                   notes = EXCLUDED.notes,
-                  metadata = EXCLUDED.metadata
-            """, (workout_notion_id, name, variation, sets, reps, weight, rir, notes, metadata))
+                  metadata = EXCLUDED.metadata,
+                  notion_id = COALESCE(EXCLUDED.notion_id, exercises.notion_id)
+            """, (workout_notion_id, name, variation, sets, reps, weight, rir, notes, metadata, notion_id))
+            evict_pages(cur, exercise_ids)
+            refresh_derived(cur, rows | touched_rows(cur, [workout_notion_id], exercise_ids))
+    versions.bump("exercises")
 
 def delete_exercise(workout_notion_id, name):
+    # Rows are stored under the catalog name, whatever the caller calls the exercise, unless
+    # that name was taken in the workout and the row kept the given one
+    canonical, _ = get_index().resolve(name, None)
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            rows = touched_rows(cur, [workout_notion_id])
+            cur.execute("""
+                DELETE FROM exercises WHERE workout_notion_id = %(workout)s AND name = (
+                    SELECT name FROM exercises
+                    WHERE workout_notion_id = %(workout)s AND name IN (%(name)s, %(canonical)s)
+                    ORDER BY name = %(name)s DESC
+                    LIMIT 1
+                )
+                RETURNING notion_id
+            """, {"workout": workout_notion_id, "name": name, "canonical": canonical})
+            evict_pages(cur, [row[0] for row in cur.fetchall()])
+            refresh_derived(cur, rows)
+    versions.bump("exercises")
+
+def delete_exercise_by_notion_id(notion_id):
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            rows = touched_rows(cur, exercise_ids=[notion_id])
+            cur.execute("DELETE FROM exercises WHERE notion_id = %s", (notion_id,))
+            evict_pages(cur, [notion_id])
+            refresh_derived(cur, rows)
+    versions.bump("exercises")
+
+def fetch_workout_ids():
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT notion_id FROM workouts")
+            return {row[0] for row in cur.fetchall()}
+
+def fetch_exercise_notion_ids():
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            # Rows loaded before notion_id existed can't be matched; a /resync fills them in
+            cur.execute("SELECT notion_id FROM exercises WHERE notion_id IS NOT NULL")
+            return {row[0] for row in cur.fetchall()}
+
+def get_sync_state(database_id):
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT last_edited_time FROM notion_sync_state WHERE database_id = %s", (database_id,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+def set_sync_state(database_id, last_edited_time):
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO notion_sync_state (database_id, last_edited_time)
+                VALUES (%s, %s)
+                ON CONFLICT (database_id) DO UPDATE SET
+                  last_edited_time = GREATEST(notion_sync_state.last_edited_time, EXCLUDED.last_edited_time)
+            """, (database_id, last_edited_time))
+
+def clear_sync_state():
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM notion_sync_state")
+
+# ---------- Bulk loading ----------
+WORKOUT_COLUMNS = ("notion_id", "date", "personal_notes", "coach_notes", "metadata")
+EXERCISE_COLUMNS = ("workout_notion_id", "name", "variation", "sets", "reps", "weight", "rir", "notes", "metadata", "notion_id")
+
+BULK_STAGING_SQL = """
+    CREATE TEMP TABLE workouts_staging (
+        ord INT,
+        notion_id TEXT,
+        date DATE,
+        personal_notes TEXT,
+        coach_notes TEXT,
+        metadata JSONB
+    ) ON COMMIT DROP;
+
+    CREATE TEMP TABLE exercises_staging (
+        ord INT,
+        workout_notion_id TEXT,
+        name TEXT,
+        variation TEXT,
+        sets INT,
+        reps INT,
+        weight numeric(10,2),
+        rir INT,
+        notes TEXT,
+        metadata JSONB,
+        notion_id TEXT
+    ) ON COMMIT DROP;
+"""
+
+# A page listed twice keeps its last version, the same outcome as upserting row by row.
+# Formatted with the target tables: the live ones, or the shadow copies during a resync.
+BULK_UPSERT_SQL = """
+    INSERT INTO {workouts} (notion_id, date, personal_notes, coach_notes, metadata)
+    SELECT DISTINCT ON (notion_id) notion_id, date, personal_notes, coach_notes, metadata
+    FROM workouts_staging
+    ORDER BY notion_id, ord DESC
+    ON CONFLICT (notion_id) DO UPDATE SET
+      date = EXCLUDED.date,
+      personal_notes = EXCLUDED.personal_notes,
+      coach_notes = EXCLUDED.coach_notes,
+      metadata = EXCLUDED.metadata;
+
+    -- Pages moved to another workout or renamed leave their old row behind
+    DELETE FROM {exercises} e
+    USING exercises_staging s
+    WHERE e.notion_id = s.notion_id
+      AND (e.workout_notion_id, e.name) <> (s.workout_notion_id, s.name);
+
+    INSERT INTO {exercises} (workout_notion_id, name, variation, sets, reps, weight, rir, notes, metadata, notion_id)
+    SELECT DISTINCT ON (s.workout_notion_id, s.name)
+           s.workout_notion_id, s.name, s.variation, s.sets, s.reps, s.weight, s.rir, s.notes, s.metadata, s.notion_id
+    FROM exercises_staging s
+    JOIN {workouts} w ON w.notion_id = s.workout_notion_id
+    ORDER BY s.workout_notion_id, s.name, s.ord DESC
+    ON CONFLICT (workout_notion_id, name) DO UPDATE SET
+      variation = EXCLUDED.variation,
+      sets = EXCLUDED.sets,
+      reps = EXCLUDED.reps,
+      weight = EXCLUDED.weight,
+      rir = EXCLUDED.rir,
+      notes = EXCLUDED.notes,
+      metadata = EXCLUDED.metadata,
+      notion_id = COALESCE(EXCLUDED.notion_id, {exercises}.notion_id);
+"""
+
+# Runs in one short transaction: readers keep seeing the old rows until it commits.
+# The tables themselves stay put because the vw_* views and the foreign key are bound to them.
+SWAP_SHADOW_SQL = """
+    DELETE FROM exercises;
+    DELETE FROM workouts;
+
+    INSERT INTO workouts ({workout_columns})
+    SELECT {workout_columns} FROM workouts_shadow;
+
+    INSERT INTO exercises ({exercise_columns})
+    SELECT {exercise_columns} FROM exercises_shadow;
+
+    DROP TABLE exercises_shadow, workouts_shadow;
+"""
+
+# ---------- Training rollups ----------
+# Per-day volume and set credit for every taxonomy target, so the vw_* rollups read
+# precomputed rows instead of joining the whole exercise history on every query
+TARGET_ROLLUP_SQL = """
+    CREATE TABLE IF NOT EXISTS target_daily_rollup (
+        d           date NOT NULL,
+        target_path text NOT NULL,
+        volume      numeric NOT NULL,
+        sets        numeric NOT NULL,
+        PRIMARY KEY (d, target_path)
+    );
+"""
+
+# Same arithmetic as vw_exercise_daily_volume / vw_exercise_daily_sets: volume is
+# weight x reps and every exercise row counts as one set, both scaled by the contribution
+ROLLUP_INSERT_SQL = """
+    INSERT INTO target_daily_rollup (d, target_path, volume, sets)
+    SELECT
+        W.date,
+        m.target_path,
+        SUM(GREATEST(COALESCE(E.weight,0),0) * GREATEST(COALESCE(E.reps,0),0) * m.contribution),
+        SUM(m.contribution)
+    FROM workouts W
+    JOIN exercises E ON E.workout_notion_id = W.notion_id
+    JOIN exercise_target_map m
+      ON m.name = E.name
+     AND m.variation = COALESCE(E.variation, '')
+    WHERE W.date IS NOT NULL {filter}
+    GROUP BY W.date, m.target_path
+"""
+
+TOUCHED_ROWS_SQL = """
+    SELECT W.date, E.name, COALESCE(E.variation,'')
+    FROM workouts W
+    LEFT JOIN exercises E ON E.workout_notion_id = W.notion_id
+    WHERE W.notion_id = ANY(%s::text[])
+    UNION
+    SELECT W.date, E.name, COALESCE(E.variation,'')
+    FROM exercises E
+    JOIN workouts W ON W.notion_id = E.workout_notion_id
+    WHERE E.notion_id = ANY(%s::text[])
+"""
+
+def touched_rows(cur, workout_ids=(), exercise_ids=()):
+    """
+    (day, exercise, variation) of the given workouts' exercises and of the given exercise
+    pages as they currently are. Write paths take it before and after the write, so
+    both the old and the new state get their derived rows refreshed.
+    """
+    cur.execute(TOUCHED_ROWS_SQL, (list(workout_ids), list(exercise_ids)))
+    return set(cur.fetchall())
+
+def refresh_derived(cur, rows):
+    refresh_rollups(cur, {d for d, _, _ in rows if d is not None})
+    refresh_records(cur, NOTION_SOURCE, {(name, variation) for _, name, variation in rows if name is not None})
+    days = [d for d, _, _ in rows if d is not None]
+    if days:
+        refresh_training_load(cur, min(days))
+    refresh_set_links(cur, set(days))
+
+def refresh_rollups(cur, days):
+    if not days:
+        return
+    days = sorted(days)
+    cur.execute("DELETE FROM target_daily_rollup WHERE d = ANY(%s::date[])", (days,))
+    cur.execute(ROLLUP_INSERT_SQL.format(filter="AND W.date = ANY(%(days)s::date[])"), {"days": days})
+
+def refresh_all_rollups(cur):
+    cur.execute("TRUNCATE target_daily_rollup")
+    cur.execute(ROLLUP_INSERT_SQL.format(filter=""))
+
+# ---------- Personal records ----------
+NOTION_SOURCE = "notion"
+GARMIN_SOURCE = "garmin"
+
+# One row per record, so a PR dashboard is a primary key lookup. `reps` is only
+# meaningful for the best weight per rep count and is 0 for the other records.
+RECORDS_SQL = """
+    CREATE TABLE IF NOT EXISTS personal_records (
+        source      text NOT NULL,
+        exercise    text NOT NULL,
+        variation   text NOT NULL,
+        record      text NOT NULL,  -- e1rm | weight | session_volume
+        reps        int  NOT NULL,
+        value       numeric NOT NULL,
+        achieved_on date,
+        ref         text,           -- workout notion_id / garmin activity_id
+        PRIMARY KEY (source, exercise, variation, record, reps)
+    );
+"""
+
+RECORD_KEYS_FILTER = """
+    (exercise, variation) IN (SELECT * FROM unnest(%(exercises)s::text[], %(variations)s::text[]))
+"""
+
+# The best value per record; ties go to the first time it was reached
+RECORDS_INSERT_SQL = """
+    INSERT INTO personal_records (source, exercise, variation, record, reps, value, achieved_on, ref)
+    SELECT DISTINCT ON (exercise, variation, record, reps)
+        %(source)s, exercise, variation, record, reps, value, d, ref
+    FROM ({candidates}) c
+    WHERE value IS NOT NULL {filter}
+    ORDER BY exercise, variation, record, reps, value DESC, d, ref
+"""
+
+# A Notion exercise row is one exercise in one workout: sets x reps at a weight. The
+# records are unpivoted per row so the key filter can still reach the index.
+NOTION_RECORD_CANDIDATES = """
+    SELECT
+        E.name                   AS exercise,
+        COALESCE(E.variation,'') AS variation,
+        r.record,
+        r.reps,
+        r.value,
+        W.date                   AS d,
+        W.notion_id              AS ref
+    FROM exercises E
+    JOIN workouts W ON W.notion_id = E.workout_notion_id
+    CROSS JOIN LATERAL (VALUES
+        ('e1rm', 0, E.estimated_1rm),
+        ('weight', E.reps, CASE WHEN E.reps > 0 THEN E.weight END),
+        ('session_volume', 0, COALESCE(E.sets,1) * E.reps * E.weight)
+    ) AS r(record, reps, value)
+"""
+
+# Garmin stores one row per set; the session volume sums the sets of an activity
+GARMIN_RECORD_CANDIDATES = """
+    SELECT exercise_name AS exercise, '' AS variation, 'e1rm' AS record, 0 AS reps,
+           estimated_1rm::numeric AS value, start_time::date AS d, activity_id AS ref
+    FROM garmin_strength_exercises
+    WHERE exercise_name IS NOT NULL
+    UNION ALL
+    SELECT exercise_name, '', 'weight', repetitions, weight::numeric, start_time::date, activity_id
+    FROM garmin_strength_exercises
+    WHERE exercise_name IS NOT NULL AND repetitions > 0
+    UNION ALL
+    SELECT exercise_name, '', 'session_volume', 0, SUM(repetitions * weight)::numeric, MIN(start_time)::date, activity_id
+    FROM garmin_strength_exercises
+    WHERE exercise_name IS NOT NULL
+    GROUP BY activity_id, exercise_name
+"""
+
+RECORD_CANDIDATES = {NOTION_SOURCE: NOTION_RECORD_CANDIDATES, GARMIN_SOURCE: GARMIN_RECORD_CANDIDATES}
+
+def init_records(cur):
+    cur.execute(RECORDS_SQL)
+
+def refresh_records(cur, source, keys):
+    """Recomputes the records of the given (exercise, variation) keys of one source."""
+    if not keys:
+        return
+    exercises, variations = zip(*sorted(keys))
+    params = {"source": source, "exercises": list(exercises), "variations": list(variations)}
+    cur.execute("DELETE FROM personal_records WHERE source = %(source)s AND " + RECORD_KEYS_FILTER, params)
+    cur.execute(RECORDS_INSERT_SQL.format(candidates=RECORD_CANDIDATES[source], filter="AND " + RECORD_KEYS_FILTER), params)
+
+def refresh_all_records(cur, source):
+    cur.execute("DELETE FROM personal_records WHERE source = %s", (source,))
+    cur.execute(RECORDS_INSERT_SQL.format(candidates=RECORD_CANDIDATES[source], filter=""), {"source": source})
+
+def fetch_personal_records(source=None, exercise=None, variation=None, record=None):
+    with get_fitness_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT source, exercise, variation, record, reps, value, achieved_on AS "achievedOn", ref
+                FROM personal_records
+                WHERE (%(source)s::text IS NULL OR source = %(source)s)
+                  AND (%(exercise)s::text IS NULL OR exercise = %(exercise)s)
+                  AND (%(variation)s::text IS NULL OR variation = %(variation)s)
+                  AND (%(record)s::text IS NULL OR record = %(record)s)
+                ORDER BY source, exercise, variation, record, reps
+            """, {"source": source, "exercise": exercise, "variation": variation, "record": record})
+            return cur.fetchall()
+
+# ---------- Training analytics ----------
+# Same arithmetic as vw_exercise_daily_volume / vw_exercise_daily_sets
+EXERCISE_DAILY_TOTALS_SQL = """
+    SELECT
+        W.date                   AS d,
+        E.name                   AS name,
+        COALESCE(E.variation,'') AS variation,
+        SUM(GREATEST(COALESCE(E.weight,0),0) * GREATEST(COALESCE(E.reps,0),0)) AS volume,
+        COUNT(*)                 AS sets
+    FROM workouts W
+    JOIN exercises E ON E.workout_notion_id = W.notion_id
+    WHERE W.date IS NOT NULL
+      AND (%(date_from)s::date IS NULL OR W.date >= %(date_from)s::date)
+      AND (%(date_to)s::date IS NULL OR W.date <= %(date_to)s::date)
+    GROUP BY W.date, E.name, COALESCE(E.variation,'')
+"""
+
+def fetch_exercise_daily_totals(date_from=None, date_to=None):
+    with get_fitness_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(EXERCISE_DAILY_TOTALS_SQL, {"date_from": date_from, "date_to": date_to})
+            return cur.fetchall()
+
+def fetch_attribution_seeds():
+    """The exercise-to-target contributions and the taxonomy they point into."""
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT name, variation, target_path, contribution FROM exercise_target_map")
+            contributions = cur.fetchall()
+            cur.execute("SELECT path, name, level FROM muscle_taxonomy")
+            taxonomy = cur.fetchall()
+            cur.execute("SELECT ancestor, descendant FROM muscle_taxonomy_closure")
+            closure = cur.fetchall()
+            return contributions, taxonomy, closure
+
+def bulk_upsert(workouts, exercises, removed_exercises=(), pages=()):
+    """
+    Loads parsed workouts and exercises (tuples in WORKOUT_COLUMNS / EXERCISE_COLUMNS order)
+    through COPY into staging tables and upserts them set-based, all in one transaction.
+    `pages` are the Notion pages they were parsed from, cached as part of the same commit.
+    """
+    if not (workouts or exercises or removed_exercises):
+        return
+
     with get_fitness_connection() as conn:
         with conn.cursor() as cur:
+            exercises = normalize_exercises(exercises, cur)
+            workout_ids = [w[0] for w in workouts] + [e[0] for e in exercises]
+            exercise_ids = [e[-1] for e in exercises if e[-1]] + list(removed_exercises)
+            rows = touched_rows(cur, workout_ids, exercise_ids)
+
+            load_staged(cur, workouts, exercises, "workouts", "exercises")
+
+            if removed_exercises:
+                cur.execute("DELETE FROM exercises WHERE notion_id = ANY(%s)", (list(removed_exercises),))
+
+            store_pages(cur, pages, [e[-1] for e in exercises])
+            refresh_derived(cur, rows | touched_rows(cur, workout_ids, exercise_ids))
+    versions.bump(*TRAINING_TABLES)
+
+def build_shadow(workouts, exercises):
+    """Loads a full resync into the shadow tables while the live ones keep serving reads."""
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            # Created afresh from the live tables, so they always have the current columns
             cur.execute("""
-                DELETE FROM exercises WHERE workout_notion_id = %s AND name = %s
-            """, (workout_notion_id, name))
+                DROP TABLE IF EXISTS exercises_shadow, workouts_shadow;
+                CREATE TABLE workouts_shadow (LIKE workouts INCLUDING ALL);
+                CREATE TABLE exercises_shadow (LIKE exercises INCLUDING ALL);
+            """)
+            # Every exercise is in the batch, so there are no stored names to collide with
+            load_staged(cur, workouts, normalize_exercises(exercises), "workouts_shadow", "exercises_shadow")
 
-def delete_all_workouts_and_exercises():
+def swap_shadow(pages=(), linked_exercise_ids=()):
     with get_fitness_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM exercises")
-            cur.execute("DELETE FROM workouts")
+            cur.execute(SWAP_SHADOW_SQL.format(
+                workout_columns=", ".join(WORKOUT_COLUMNS),
+                exercise_columns=", ".join(EXERCISE_COLUMNS),
+            ))
+            # The live tables were rebuilt from scratch, and so is the cache describing them
+            clear_page_cache(cur)
+            store_pages(cur, pages, linked_exercise_ids)
+            refresh_all_rollups(cur)
+            refresh_all_records(cur, NOTION_SOURCE)
+            refresh_training_load(cur)
+            refresh_set_links(cur)
+    versions.bump(*TRAINING_TABLES)
+
+def load_staged(cur, workouts, exercises, workouts_table, exercises_table):
+    cur.execute(BULK_STAGING_SQL)
+    copy_rows(cur, "workouts_staging", ("ord",) + WORKOUT_COLUMNS, ((i, *w) for i, w in enumerate(workouts)))
+    copy_rows(cur, "exercises_staging", ("ord",) + EXERCISE_COLUMNS, ((i, *e) for i, e in enumerate(exercises)))
+
+    cur.execute(f"""
+        SELECT count(*) FROM exercises_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM {workouts_table} w WHERE w.notion_id = s.workout_notion_id)
+          AND NOT EXISTS (SELECT 1 FROM workouts_staging w WHERE w.notion_id = s.workout_notion_id)
+    """)
+    orphans = cur.fetchone()[0]
+    if orphans:
+        print(f"Skipping {orphans} exercises linked to unknown workouts")
+
+    cur.execute(BULK_UPSERT_SQL.format(workouts=workouts_table, exercises=exercises_table))
+
+def copy_rows(cur, table, columns, rows):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_value(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    return (str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
 
 
 
@@ -212,6 +710,38 @@ TAXONOMY_SQL = """
     ON CONFLICT DO NOTHING;
     """
 
+# Precomputed hierarchy, rebuilt after the seed above on every start. Like the views always
+# did, it follows the dotted paths: a few seeds carry a parent_path that disagrees with them.
+TAXONOMY_CLOSURE_SQL = """
+    ALTER TABLE muscle_taxonomy ADD COLUMN IF NOT EXISTS level int;
+    ALTER TABLE muscle_taxonomy ADD COLUMN IF NOT EXISTS is_leaf boolean;
+
+    CREATE TABLE IF NOT EXISTS muscle_taxonomy_closure (
+        ancestor   text NOT NULL REFERENCES muscle_taxonomy(path) ON DELETE CASCADE,
+        descendant text NOT NULL REFERENCES muscle_taxonomy(path) ON DELETE CASCADE,
+        depth      int  NOT NULL,  -- 0 for the node itself
+        PRIMARY KEY (descendant, ancestor)
+    );
+    CREATE INDEX IF NOT EXISTS ix_muscle_taxonomy_closure_ancestor
+        ON muscle_taxonomy_closure (ancestor, depth);
+
+    UPDATE muscle_taxonomy
+    SET level = array_length(string_to_array(path, '.'), 1);
+
+    TRUNCATE muscle_taxonomy_closure;
+    INSERT INTO muscle_taxonomy_closure (ancestor, descendant, depth)
+    SELECT a.path, d.path, d.level - a.level
+    FROM muscle_taxonomy d
+    JOIN muscle_taxonomy a
+      ON a.path = d.path
+      OR left(d.path, length(a.path) + 1) = a.path || '.';
+
+    UPDATE muscle_taxonomy t
+    SET is_leaf = NOT EXISTS (
+        SELECT 1 FROM muscle_taxonomy_closure c WHERE c.ancestor = t.path AND c.depth > 0
+    );
+"""
+
 EXERCISES_META = """
     CREATE TABLE IF NOT EXISTS exercise_meta (
     name    text NOT NULL,
@@ -858,21 +1388,18 @@ TAXONOMY_ROLLUP_VIEWS = """
         FROM sets
         GROUP BY d, name, variation;
 
-    -- DAILY VOLUME RAW
+    -- DAILY VOLUME RAW (maintained in target_daily_rollup)
     CREATE OR REPLACE VIEW vw_target_daily_volume_raw AS
         SELECT
-        v.d,
-        m.target_path,
+        r.d,
+        r.target_path,
         t.name                      AS target_name,
-        (v.volume * m.contribution) AS volume_contrib,
+        r.volume                    AS volume_contrib,
         /* depth = number of segments in path (upper=1, upper.chest=2, …) */
-        COALESCE(NULLIF(array_length(string_to_array(m.target_path, '.'), 1),0),1) AS depth
-        FROM vw_exercise_daily_volume v
-        JOIN exercise_target_map m
-        ON m.name = v.name
-        AND m.variation = v.variation
+        t.level                     AS depth
+        FROM target_daily_rollup r
         JOIN muscle_taxonomy t
-        ON t.path = m.target_path;
+        ON t.path = r.target_path;
 
     -- REGION DAILY VOLUME
     CREATE OR REPLACE VIEW vw_region_daily_volume AS
@@ -925,30 +1452,20 @@ TAXONOMY_ROLLUP_VIEWS = """
     -- Leaf = node with no children. We include depth >= 3 so every row
     -- has region, group, and at least a muscle. Depth-3 leaves get submuscle = NULL.
     CREATE OR REPLACE VIEW vw_taxonomy_leaf_nodes AS
-    WITH leaves AS (
-        SELECT
-            t.path,
-            t.name,
-            array_length(string_to_array(t.path, '.'), 1) AS depth,
-            split_part(t.path, '.', 1) AS s1,  -- region key
-            split_part(t.path, '.', 2) AS s2,  -- group key
-            split_part(t.path, '.', 3) AS s3,  -- muscle key (if present)
-            split_part(t.path, '.', 4) AS s4   -- submuscle key (if present)
-        FROM muscle_taxonomy t
-        WHERE NOT EXISTS (
-            SELECT 1 FROM muscle_taxonomy c WHERE c.parent_path = t.path
-        )
-            AND array_length(string_to_array(t.path, '.'), 1) >= 3
-        )
         SELECT
         r.name AS region,
         g.name AS "group",
         m.name AS muscle,
-        CASE WHEN l.depth = 4 THEN l.name ELSE NULL END AS submuscle
-        FROM leaves l
-        JOIN muscle_taxonomy r ON r.path = l.s1
-        JOIN muscle_taxonomy g ON g.path = l.s1 || '.' || l.s2
-        JOIN muscle_taxonomy m ON m.path = l.s1 || '.' || l.s2 || '.' || l.s3
+        CASE WHEN l.level = 4 THEN l.name ELSE NULL END AS submuscle
+        FROM muscle_taxonomy l
+        JOIN muscle_taxonomy_closure cr ON cr.descendant = l.path AND cr.depth = l.level - 1
+        JOIN muscle_taxonomy r ON r.path = cr.ancestor
+        JOIN muscle_taxonomy_closure cg ON cg.descendant = l.path AND cg.depth = l.level - 2
+        JOIN muscle_taxonomy g ON g.path = cg.ancestor
+        JOIN muscle_taxonomy_closure cm ON cm.descendant = l.path AND cm.depth = l.level - 3
+        JOIN muscle_taxonomy m ON m.path = cm.ancestor
+        WHERE l.is_leaf
+          AND l.level >= 3
         ORDER BY region, "group", muscle, submuscle;
 
 
@@ -986,17 +1503,14 @@ TAXONOMY_ROLLUP_VIEWS = """
 
     CREATE OR REPLACE VIEW vw_target_daily_sets_raw AS
         SELECT
-        v.d,
-        m.target_path,
+        r.d,
+        r.target_path,
         t.name      AS target_name,
-        (v.sets * m.contribution)::numeric AS sets_contrib,
-        array_length(string_to_array(m.target_path,'.'),1) AS depth
-        FROM vw_exercise_daily_sets v
-        JOIN exercise_target_map m
-        ON m.name = v.name
-        AND m.variation = v.variation
+        r.sets      AS sets_contrib,
+        t.level     AS depth
+        FROM target_daily_rollup r
         JOIN muscle_taxonomy t
-        ON t.path = m.target_path;
+        ON t.path = r.target_path;
 
     CREATE OR REPLACE VIEW vw_region_daily_sets AS
         SELECT
@@ -1019,36 +1533,16 @@ TAXONOMY_ROLLUP_VIEWS = """
         ORDER BY d, target_name;
 
     CREATE OR REPLACE VIEW vw_muscle_daily_sets AS
-        WITH raw AS (
+        -- muscle-level and submuscle-level entries, credited to their level-3 ancestor (or themselves)
         SELECT
-            r.d,
-            r.target_path,
-            r.sets_contrib,
-            array_length(string_to_array(r.target_path,'.'),1) AS depth
-        FROM vw_target_daily_sets_raw r
-        )
-        , muskey AS (
-        SELECT
-            d,
-            -- if depth=3, keep as-is; if depth=4, trim to first 3 segments
-            CASE
-            WHEN depth = 3 THEN target_path
-            WHEN depth = 4 THEN
-                split_part(target_path,'.',1) || '.' ||
-                split_part(target_path,'.',2) || '.' ||
-                split_part(target_path,'.',3)
-            END AS muscle_path,
-            sets_contrib
-        FROM raw
-        WHERE depth IN (3,4)   -- only muscle-level and submuscle-level entries
-        )
-        SELECT
-        m.d::timestamp                     AS "time",
+        r.d::timestamp                     AS "time",
         t.name                             AS muscle,
-        SUM(m.sets_contrib)::numeric       AS value
-        FROM muskey m
-        JOIN muscle_taxonomy t ON t.path = m.muscle_path
-        GROUP BY m.d, t.name
+        SUM(r.sets_contrib)::numeric       AS value
+        FROM vw_target_daily_sets_raw r
+        JOIN muscle_taxonomy_closure c ON c.descendant = r.target_path AND c.depth = r.depth - 3
+        JOIN muscle_taxonomy t ON t.path = c.ancestor
+        WHERE r.depth IN (3,4)
+        GROUP BY r.d, t.name
         ORDER BY "time", muscle;
 
     CREATE OR REPLACE VIEW vw_submuscle_daily_sets AS
@@ -1,35 +1,48 @@
-from fastapi import APIRouter, Request
-from workouts.data import (create_exercise, delete_exercise)
-from workouts.notion import (fetch_notion_page, parse_exercise)
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
+from versions import etag_response
+from workouts.data import (delete_exercise, delete_exercise_by_notion_id, TRAINING_TABLES, SEED_TABLES)
+from workouts.coalesce import EXERCISE, enqueue, discard, write_lock
+from workouts.normalize import fetch_unmapped_exercises, CATALOG_TABLES
 
 router = APIRouter()
 
 @router.post("/added")
 async def exercise_added(req: Request):
     page_id = (await req.json())["page_id"]
-    page = fetch_notion_page(page_id)
-    result = parse_exercise(page)
-    if result:
-        workout_id, name, meta = result
-        create_exercise(workout_id, name, meta)
+    enqueue(EXERCISE, page_id)
     return {"status": "ok"}
 
 @router.post("/changed")
 async def exercise_changed(req: Request):
     page_id = (await req.json())["page_id"]
-    page = fetch_notion_page(page_id)
-    result = parse_exercise(page)
-    if result:
-        workout_id, name, meta = result
-        delete_exercise(workout_id, name)
-        create_exercise(workout_id, name, meta)
+    enqueue(EXERCISE, page_id)
     return {"status": "ok"}
 
 @router.post("/deleted")
 async def exercise_deleted(req: Request):
     body = await req.json()
+    page_id = body.get("page_id")
     workout_id = body.get("workout_id")
     name = body.get("name")
-    if workout_id and name:
-        delete_exercise(workout_id.replace("-", ""), name)
-    return {"status": "ok"}
\ No newline at end of file
+    if page_id:
+        discard(page_id)
+    async with write_lock:
+        if page_id:
+            await run_in_threadpool(delete_exercise_by_notion_id, page_id.replace("-", ""))
+        if workout_id and name:
+            await run_in_threadpool(delete_exercise, workout_id.replace("-", ""), name)
+    return {"status": "ok"}
+
+@router.get("/unmapped", summary="Exercises the rollups can't attribute to a muscle, with their volume and the closest catalog entry")
+def get_unmapped(
+    request: Request,
+    response: Response,
+    dateFrom: Optional[date] = Query(None),
+    dateTo: Optional[date] = Query(None)):
+    not_modified = etag_response(request, response, *TRAINING_TABLES, *SEED_TABLES, *CATALOG_TABLES)
+    if not_modified:
+        return not_modified
+    return fetch_unmapped_exercises(dateFrom, dateTo)
\ No newline at end of file
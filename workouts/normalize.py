@@ -0,0 +1,306 @@
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+from psycopg2.extras import RealDictCursor
+from connections import get_fitness_connection
+import versions
+
+# Exercises are stored under their exercise_meta key, so the rollups can join on plain
+# equality; anything that can't be resolved here is kept as written and reported
+CATALOG_TABLES = ("exercise_meta", "exercise_aliases")
+
+# Jaccard similarity of the trigram sets a fuzzy match needs before it is trusted
+NAME_SIMILARITY = 0.6
+VARIATION_SIMILARITY = 0.6
+# Below this the closest catalog entry isn't worth suggesting as an alias
+SUGGEST_SIMILARITY = 0.3
+
+ALIASES_SQL = """
+    CREATE TABLE IF NOT EXISTS exercise_aliases (
+        alias           text NOT NULL,
+        alias_variation text NOT NULL DEFAULT '',
+        name            text NOT NULL,
+        variation       text NOT NULL DEFAULT '',
+        PRIMARY KEY (alias, alias_variation),
+        FOREIGN KEY (name, variation)
+            REFERENCES exercise_meta(name, variation) ON DELETE CASCADE
+    );
+
+    -- Names that differ from the catalog by more than case, punctuation or a typo
+    INSERT INTO exercise_aliases (alias, alias_variation, name, variation) VALUES
+    ('Hammer Curl','','Bicep Curl','Hammer'),
+    ('Incline Curl','','Bicep Curl','Incline'),
+    ('Incline Hammer Curl','','Bicep Curl','Hammer Incline'),
+    ('Zottman Curl','','Bicep Curl','Zottman'),
+    ('Dumbbell Row','','One-Arm Row',''),
+    ('Overhead Press','','Shoulder Press',''),
+    ('Military Press','','Shoulder Press',''),
+    ('Flat Bench Press','','Bench Press','Flat'),
+    ('Incline Bench Press','','Bench Press','Incline'),
+    ('Incline Sit-Up','','Sit-Up','Incline'),
+    ('Decline Sit-Up','','Sit-Up','Decline'),
+    ('Romanian Deadlift','','RDL','')
+    ON CONFLICT (alias, alias_variation) DO UPDATE SET
+    name      = EXCLUDED.name,
+    variation = EXCLUDED.variation;
+"""
+
+# Everything the rollups can't attribute: the name isn't in the catalog, the variation
+# isn't, or the pair exists but has no exercise_target_map rows
+UNMAPPED_SQL = """
+    SELECT
+        u.name,
+        u.variation,
+        CASE
+            WHEN NOT EXISTS (SELECT 1 FROM exercise_meta m WHERE m.name = u.name) THEN 'unknown_exercise'
+            WHEN NOT EXISTS (SELECT 1 FROM exercise_meta m WHERE m.name = u.name AND m.variation = u.variation) THEN 'unknown_variation'
+            ELSE 'no_targets'
+        END AS reason,
+        u.sets,
+        u.volume,
+        u.first_date,
+        u.last_date
+    FROM (
+        SELECT
+            E.name,
+            COALESCE(E.variation,'') AS variation,
+            COUNT(*) AS sets,
+            SUM(GREATEST(COALESCE(E.weight,0),0) * GREATEST(COALESCE(E.reps,0),0)) AS volume,
+            MIN(W.date) AS first_date,
+            MAX(W.date) AS last_date
+        FROM exercises E
+        JOIN workouts W ON W.notion_id = E.workout_notion_id
+        WHERE NOT EXISTS (
+                SELECT 1 FROM exercise_target_map m
+                WHERE m.name = E.name AND m.variation = COALESCE(E.variation,'')
+            )
+          AND (%(date_from)s::date IS NULL OR W.date >= %(date_from)s::date)
+          AND (%(date_to)s::date IS NULL OR W.date <= %(date_to)s::date)
+        GROUP BY E.name, COALESCE(E.variation,'')
+    ) u
+    ORDER BY u.volume DESC, u.sets DESC, u.name
+"""
+
+# Names already held in the batch's workouts by pages outside the batch. Rows without a
+# notion_id predate it and are the same exercise, which the upsert merges into.
+TAKEN_NAMES_SQL = """
+    SELECT workout_notion_id, name, notion_id
+    FROM exercises
+    WHERE workout_notion_id = ANY(%s)
+      AND notion_id IS NOT NULL
+      AND NOT (notion_id = ANY(%s))
+"""
+
+def name_key(name: str) -> str:
+    # Case, spaces and punctuation don't matter: "Pull Up", "pull-up" and "Pullup" are one key
+    return "".join(ch for ch in name.lower() if ch.isalnum())
+
+def variation_key(variation: str) -> str:
+    # Variations are multi-select tags joined by spaces, so the word order doesn't matter either
+    return " ".join(sorted(re.findall(r"[a-z0-9]+", variation.lower())))
+
+def trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared) if shared else 0.0
+
+class TrigramIndex:
+    """Inverted trigram index over a fixed set of keys, for closest-key lookups."""
+    def __init__(self, keys):
+        self._trigrams = {key: trigrams(key) for key in keys if key}
+        self._postings = defaultdict(set)
+        for key, grams in self._trigrams.items():
+            for gram in grams:
+                self._postings[gram].add(key)
+
+    def closest(self, key: str) -> Tuple[Optional[str], float]:
+        grams = trigrams(key)
+        candidates = set()
+        for gram in grams:
+            candidates |= self._postings.get(gram, set())
+
+        best, best_score = None, 0.0
+        # Sorted so ties resolve the same way on every load
+        for candidate in sorted(candidates):
+            score = similarity(grams, self._trigrams[candidate])
+            if score > best_score:
+                best, best_score = candidate, score
+        return best, best_score
+
+@dataclass
+class ExerciseIndex:
+    version: Tuple[int, ...]
+    # (name key, variation key) -> catalog (name, variation), aliases included
+    exact: Dict[Tuple[str, str], Tuple[str, str]]
+    # name key -> catalog name
+    names: Dict[str, str]
+    # catalog name -> {variation key: catalog variation}
+    variations: Dict[str, Dict[str, str]]
+    name_trigrams: TrigramIndex
+    # catalog name -> trigram index over its variation keys
+    variation_trigrams: Dict[str, TrigramIndex]
+
+    def resolve(self, name: str, variation: Optional[str]) -> Tuple[str, str]:
+        """The catalog key for an incoming name and variation, or both unchanged when there is none."""
+        variation = variation or ""
+        key = (name_key(name), variation_key(variation))
+        if key in self.exact:
+            return self.exact[key]
+
+        canonical = self._name(key[0])
+        if canonical is None:
+            return name, variation
+
+        known = self.variations[canonical]
+        if key[1] in known:
+            return canonical, known[key[1]]
+        match, score = self.variation_trigrams[canonical].closest(key[1]) if key[1] else (None, 0.0)
+        return canonical, known[match] if score >= VARIATION_SIMILARITY else variation
+
+    def suggest(self, name: str, variation: str) -> Optional[Dict]:
+        """The closest catalog entry whatever the similarity, as a hint for a new alias."""
+        key = name_key(name)
+        if key in self.names:
+            canonical, score = self.names[key], 1.0
+        else:
+            match, score = self.name_trigrams.closest(key)
+            if score < SUGGEST_SIMILARITY:
+                return None
+            canonical = self.names[match]
+
+        if variation:
+            match, variation_score = self.variation_trigrams[canonical].closest(variation_key(variation))
+            if variation_score < SUGGEST_SIMILARITY:
+                return None
+            score = min(score, variation_score)
+        return {
+            "name": canonical,
+            "variation": self.variations[canonical][match] if variation else "",
+            "similarity": round(score, 3),
+        }
+
+    def _name(self, key: str) -> Optional[str]:
+        if key in self.names:
+            return self.names[key]
+        match, score = self.name_trigrams.closest(key)
+        return self.names[match] if score >= NAME_SIMILARITY else None
+
+def load_index(cur) -> ExerciseIndex:
+    version = versions.current(*CATALOG_TABLES)
+    cur.execute("SELECT name, variation FROM exercise_meta")
+    catalog = cur.fetchall()
+    cur.execute("SELECT alias, alias_variation, name, variation FROM exercise_aliases")
+    aliases = cur.fetchall()
+
+    names = {}
+    variations = defaultdict(dict)
+    exact = {}
+    for name, variation in catalog:
+        names[name_key(name)] = name
+        variations[name][variation_key(variation)] = variation
+        exact[(name_key(name), variation_key(variation))] = (name, variation)
+    for alias, alias_variation, name, variation in aliases:
+        exact[(name_key(alias), variation_key(alias_variation))] = (name, variation)
+
+    return ExerciseIndex(
+        version=version,
+        exact=exact,
+        names=names,
+        variations=dict(variations),
+        name_trigrams=TrigramIndex(names),
+        variation_trigrams={name: TrigramIndex(known) for name, known in variations.items()},
+    )
+
+_index: ExerciseIndex = None
+_lock = threading.Lock()
+
+def get_index() -> ExerciseIndex:
+    global _index
+    with _lock:
+        if _index is None or _index.version != versions.current(*CATALOG_TABLES):
+            with get_fitness_connection() as conn:
+                with conn.cursor() as cur:
+                    _index = load_index(cur)
+        return _index
+
+def init_aliases(cur):
+    cur.execute(ALIASES_SQL)
+
+def normalize_exercises(exercises, cur=None):
+    """
+    Rewrites name and variation of parsed exercise tuples (EXERCISE_COLUMNS order) to catalog keys.
+    Rows are keyed by (workout, name), so an exercise whose catalog name another page already
+    holds in that workout (in the batch, or stored when `cur` is given) keeps its own name
+    instead of overwriting that row; /unmapped reports it.
+    """
+    if not exercises:
+        return exercises
+    index = get_index()
+    resolved = [index.resolve(e[1], e[2]) for e in exercises]
+
+    # workout -> name -> notion_id of the page holding it
+    taken = defaultdict(dict)
+    if cur is not None:
+        cur.execute(TAKEN_NAMES_SQL, (list({e[0] for e in exercises}), [e[-1] for e in exercises if e[-1]]))
+        for workout_id, name, notion_id in cur.fetchall():
+            taken[workout_id][name] = notion_id
+    # Names that were already right claim first, so "Bench Press" keeps its row next to an "Incline Bench Press"
+    for e, (name, _) in zip(exercises, resolved):
+        if name == e[1]:
+            taken[e[0]].setdefault(name, e[-1])
+
+    normalized = []
+    for e, (name, variation) in zip(exercises, resolved):
+        holder = taken[e[0]].setdefault(name, e[-1])
+        if holder is not None and e[-1] is not None and holder != e[-1]:
+            name, variation = e[1], e[2]
+        normalized.append((e[0], name, variation, *e[3:]))
+    return normalized
+
+def renormalize_exercises(cur):
+    """
+    Maps rows stored under a name the catalog didn't know at the time. Runs after the
+    seeds are loaded, so a new alias or catalog entry also fixes the history.
+    """
+    index = load_index(cur)
+    cur.execute("""
+        SELECT DISTINCT E.name, COALESCE(E.variation,'')
+        FROM exercises E
+        WHERE NOT EXISTS (
+            SELECT 1 FROM exercise_meta m WHERE m.name = E.name AND m.variation = COALESCE(E.variation,'')
+        )
+    """)
+    renamed = 0
+    for name, variation in cur.fetchall():
+        canonical = index.resolve(name, variation)
+        if canonical == (name, variation):
+            continue
+        # A workout that already has the canonical exercise keeps that row
+        cur.execute("""
+            UPDATE exercises E SET name = %(name)s, variation = %(variation)s
+            WHERE E.name = %(old_name)s
+              AND COALESCE(E.variation,'') = %(old_variation)s
+              AND (E.name = %(name)s OR NOT EXISTS (
+                  SELECT 1 FROM exercises o
+                  WHERE o.workout_notion_id = E.workout_notion_id AND o.name = %(name)s
+              ))
+        """, {"name": canonical[0], "variation": canonical[1], "old_name": name, "old_variation": variation})
+        renamed += cur.rowcount
+    if renamed:
+        print(f"Mapped {renamed} stored exercises to the catalog")
+
+def fetch_unmapped_exercises(date_from=None, date_to=None):
+    with get_fitness_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(UNMAPPED_SQL, {"date_from": date_from, "date_to": date_to})
+            rows = cur.fetchall()
+
+    index = get_index()
+    for row in rows:
+        row["suggestion"] = index.suggest(row["name"], row["variation"]) if row["reason"] != "no_targets" else None
+    return rows
@@ -1,46 +1,119 @@
-import requests
+import asyncio
+import httpx
 import os
-import json
+import orjson
+import time
+from contextlib import asynccontextmanager
 
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 HEADERS = {
     "Authorization": f"Bearer {NOTION_TOKEN}",
     "Notion-Version": "2022-06-28"
 }
-
-def fetch_notion_page(page_id):
-    url = f"https://api.notion.com/v1/pages/{page_id}"
-    r = requests.get(url, headers=HEADERS)
-    return r.json()
-
-def fetch_all_rows(db_id):
-    url = f"https://api.notion.com/v1/databases/{db_id}/query"
+WORKOUTS_DB_ID = os.getenv("NOTION_WORKOUTS_DB_ID")
+EXERCISES_DB_ID = os.getenv("NOTION_EXERCISES_DB_ID")
+
+# Notion allows an average of 3 requests per second per integration
+NOTION_RATE = 3
+NOTION_BURST = 3
+PAGE_SIZE = 100
+MAX_RETRIES = 5
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        # No await between reading and taking the token, so the event loop keeps this
+        # atomic; a negative balance is a reservation that the caller sleeps off
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+limiter = TokenBucket(NOTION_RATE, NOTION_BURST)
+
+@asynccontextmanager
+async def notion_client(client=None):
+    if client is not None:
+        yield client
+        return
+    async with httpx.AsyncClient(base_url="https://api.notion.com/v1", headers=HEADERS, timeout=30) as client:
+        yield client
+
+async def notion_request(client, method, url, **kwargs):
+    for attempt in range(MAX_RETRIES):
+        await limiter.acquire()
+        r = await client.request(method, url, **kwargs)
+        if r.status_code != 429:
+            return r.json()
+        await asyncio.sleep(float(r.headers.get("Retry-After", 2 ** attempt)))
+    r.raise_for_status()
+
+async def fetch_notion_page(page_id, client=None):
+    async with notion_client(client) as client:
+        return await notion_request(client, "GET", f"/pages/{page_id}")
+
+async def fetch_pages(page_ids):
+    async with notion_client() as client:
+        return await asyncio.gather(*(fetch_notion_page(page_id, client) for page_id in page_ids))
+
+async def fetch_all_rows(db_id, filter=None, filter_properties=None, client=None):
+    params = {"filter_properties": filter_properties} if filter_properties else None
     results = []
     has_more = True
-    payload = {}
+    payload = {"page_size": PAGE_SIZE}
+    if filter:
+        payload["filter"] = filter
 
-    while has_more:
-        res = requests.post(url, headers=HEADERS, json=payload).json()
-        print(res)
-        results.extend(res["results"])
-        has_more = res.get("has_more", False)
-        payload["start_cursor"] = res.get("next_cursor")
+    async with notion_client(client) as client:
+        while has_more:
+            res = await notion_request(client, "POST", f"/databases/{db_id}/query", params=params, json=payload)
+            results.extend(res["results"])
+            has_more = res.get("has_more", False)
+            payload["start_cursor"] = res.get("next_cursor")
 
     return results
 
-def fetch_all_workouts():
-    return fetch_all_rows(os.getenv("NOTION_WORKOUTS_DB_ID"))
-
-def fetch_all_exercises():
-    return fetch_all_rows(os.getenv("NOTION_EXERCISES_DB_ID"))
+async def fetch_rows_edited_since(db_id, since):
+    # Notion rounds last_edited_time to the minute, so on_or_after re-reads the
+    # boundary minute; upserts are idempotent so that is harmless
+    return await fetch_all_rows(db_id, filter={
+        "timestamp": "last_edited_time",
+        "last_edited_time": {"on_or_after": since.isoformat()},
+    })
+
+async def fetch_row_ids(db_id):
+    # Only the title comes back, which keeps listing a whole database cheap
+    rows = await fetch_all_rows(db_id, filter_properties=["title"])
+    return {row["id"].replace("-", "") for row in rows}
+
+def is_page_deleted(page):
+    if page.get("object") == "error":
+        return page.get("status") == 404
+    return page.get("archived", False) or page.get("in_trash", False)
+
+async def fetch_all_workouts_and_exercises():
+    # Both databases page through concurrently, sharing the client and the rate limit
+    async with notion_client() as client:
+        return await asyncio.gather(
+            fetch_all_rows(WORKOUTS_DB_ID, client=client),
+            fetch_all_rows(EXERCISES_DB_ID, client=client),
+        )
 
 def parse_workout(page):
     props = page["properties"]
+    values = extract_properties(props)
     notion_id = page["id"].replace("-", "")
     date = props["Date"]["date"]["start"]
-    personal_notes = get_rich_text(props["Personal Notes"])
-    coach_notes = get_rich_text(props["Coach Notes"])
-    metadata = flatten_notion_properties(page["properties"])
+    personal_notes = values["personal_notes"]
+    coach_notes = values["coach_notes"]
+    metadata = dump_metadata(values)
     return notion_id, date, personal_notes, coach_notes, metadata
 
 def parse_exercise(page):
@@ -54,88 +127,84 @@ def parse_exercise(page):
 
     workout_notion_id = relation[0]["id"].replace("-", "")
 
-    variation = ' '.join(sorted(item["name"] for item in props["Variation"]["multi_select"]))
-    sets = props["Sets"]["number"]
-    reps = props["Reps"]["number"]
-    weight = props["Weight"]["number"]
+    values = extract_properties(props)
+    variation = ' '.join(sorted(values["variation"]))
+    sets = values["sets"]
+    reps = values["reps"]
+    weight = values["weight"]
     rir = 0
-    notes = get_rich_text(props["Notes"])
-    metadata = flatten_notion_properties(page["properties"])
+    notes = values["notes"]
+    metadata = dump_metadata(values)
 
     return workout_notion_id, exercise_name, variation, sets, reps, weight, rir, notes, metadata
 
-def get_rich_text(prop):
-    texts = prop.get("rich_text", [])
-    value = texts[0]["plain_text"] if texts else ""
-    return value
-    
-def flatten_notion_properties(properties: dict) -> dict:
-    """
-    Flattens Notion property objects to a simple key-value dict based on type.
-    """
-    result = {}
-
-    for key, prop in properties.items():
-        prop_type = prop.get("type")
-        value = None
-
-        if prop_type == "rich_text":
-            # Get first text block's plain_text
-            texts = prop.get("rich_text", [])
-            value = texts[0]["plain_text"] if texts else ""
-
-        elif prop_type == "multi_select":
-            value = [item["name"] for item in prop.get("multi_select", [])]
-
-        elif prop_type == "select":
-            selected = prop.get("select")
-            value = selected["name"] if selected else None
-
-        elif prop_type == "number":
-            value = prop.get("number")
-
-        elif prop_type == "date":
-            date_obj = prop.get("date")
-            value = date_obj.get("start") if date_obj else None
-
-        elif prop_type == "checkbox":
-            value = prop.get("checkbox")
-
-        elif prop_type == "title":
-            title = prop.get("title", [])
-            value = title[0]["plain_text"] if title else ""
-
-        elif prop_type == "url":
-            value = prop.get("url")
-
-        elif prop_type == "email":
-            value = prop.get("email")
-
-        elif prop_type == "phone_number":
-            value = prop.get("phone_number")
-
-        elif prop_type == "people":
-            # Just extract names or emails (can be customized)
-            people = prop.get("people", [])
-            value = [person.get("name") or person.get("id") for person in people]
+# ---------- Property extraction ----------
+def _first_plain_text(key):
+    def extract(prop):
+        texts = prop.get(key, [])
+        return texts[0]["plain_text"] if texts else ""
+    return extract
+
+def _field(key):
+    return lambda prop: prop.get(key)
+
+def _select_name(prop):
+    selected = prop.get("select")
+    return selected["name"] if selected else None
+
+def _date_start(prop):
+    date_obj = prop.get("date")
+    return date_obj.get("start") if date_obj else None
+
+PROPERTY_EXTRACTORS = {
+    "rich_text": _first_plain_text("rich_text"),
+    "title": _first_plain_text("title"),
+    "multi_select": lambda prop: [item["name"] for item in prop.get("multi_select", [])],
+    "select": _select_name,
+    "number": _field("number"),
+    "date": _date_start,
+    "checkbox": _field("checkbox"),
+    "url": _field("url"),
+    "email": _field("email"),
+    "phone_number": _field("phone_number"),
+    # Just extract names or emails (can be customized)
+    "people": lambda prop: [person.get("name") or person.get("id") for person in prop.get("people", [])],
+    # Return list of related record IDs
+    "relation": lambda prop: [rel["id"] for rel in prop.get("relation", [])],
+    "status": lambda prop: prop.get("status", {}).get("name"),
+}
 
-        elif prop_type == "relation":
-            # Return list of related record IDs
-            relations = prop.get("relation", [])
-            value = [rel["id"] for rel in relations]
+# Complex/computed/system fields are left out of the metadata
+IGNORED_PROPERTY_TYPES = {"formula", "rollup", "created_by", "last_edited_by"}
 
-        elif prop_type == "status":
-            value = prop.get("status", {}).get("name")
+# Every page of a database has the same property names and types, so the extractors
+# are looked up once per schema instead of walking a type switch for every property
+_compiled_schemas = {}
 
-        elif prop_type in ["formula", "rollup", "created_by", "last_edited_by"]:
-            # Ignore complex/computed/system fields
+def compile_schema(properties: dict):
+    plan = []
+    for key, prop in properties.items():
+        prop_type = prop.get("type")
+        if prop_type in IGNORED_PROPERTY_TYPES:
             continue
-
-        else:
-            print("Unsupported prop type" + prop_type)
+        extractor = PROPERTY_EXTRACTORS.get(prop_type)
+        if extractor is None:
             # If unsupported or unknown type, just ignore
+            print(f"Unsupported prop type {prop_type} for {key}")
             continue
-
-        result[key.lower().replace(" ", "_")] = value
-
-    return json.dumps(result)
+        plan.append((key, key.lower().replace(" ", "_"), extractor))
+    return plan
+
+def extract_properties(properties: dict) -> dict:
+    """Flattens Notion property objects to a simple key-value dict based on type."""
+    schema = tuple((key, prop.get("type")) for key, prop in properties.items())
+    plan = _compiled_schemas.get(schema)
+    if plan is None:
+        plan = _compiled_schemas[schema] = compile_schema(properties)
+    return {name: extract(properties[key]) for key, name, extract in plan}
+
+def dump_metadata(values: dict) -> str:
+    return orjson.dumps(values).decode()
+
+def flatten_notion_properties(properties: dict) -> str:
+    return dump_metadata(extract_properties(properties))
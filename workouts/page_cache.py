@@ -0,0 +1,83 @@
+import orjson
+from psycopg2 import extras
+from connections import get_fitness_connection
+
+# The last version of every Notion page we wrote, so pages that come back unchanged
+# (webhook bursts, the boundary minute of an incremental sync) skip parsing and writes
+PAGE_CACHE_SQL = """
+    CREATE TABLE IF NOT EXISTS notion_page_cache (
+        page_id          text PRIMARY KEY,
+        last_edited_time timestamptz NOT NULL,
+        payload          jsonb NOT NULL
+    );
+"""
+
+# Notion rounds last_edited_time to the minute, so two edits within a minute share a
+# timestamp; the properties have to match as well before a page counts as unchanged
+UNCHANGED_PAGES_SQL = """
+    SELECT c.page_id
+    FROM notion_page_cache c
+    JOIN unnest(%s::text[], %s::timestamptz[], %s::jsonb[]) AS p(page_id, last_edited_time, properties)
+      ON p.page_id = c.page_id
+    WHERE c.last_edited_time = p.last_edited_time
+      AND c.payload->'properties' = p.properties
+"""
+
+def init_page_cache(cur):
+    cur.execute(PAGE_CACHE_SQL)
+
+def page_id(page):
+    return page["id"].replace("-", "")
+
+def unchanged_page_ids(pages):
+    if not pages:
+        return set()
+    with get_fitness_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(UNCHANGED_PAGES_SQL, (
+                [page_id(p) for p in pages],
+                [p["last_edited_time"] for p in pages],
+                [orjson.dumps(p["properties"]).decode() for p in pages],
+            ))
+            return {row[0] for row in cur.fetchall()}
+
+def drop_unchanged(*page_lists):
+    """Filters every list down to the pages that changed since they were cached; also returns the hit count."""
+    unchanged = unchanged_page_ids([p for pages in page_lists for p in pages])
+    return [[p for p in pages if page_id(p) not in unchanged] for pages in page_lists], len(unchanged)
+
+def cache_report(label, hits, total):
+    ratio = hits / total if total else 0.0
+    print(f"Notion page cache ({label}): {hits}/{total} pages unchanged ({ratio:.0%})")
+    return {"hits": hits, "misses": total - hits, "hit_ratio": round(ratio, 3)}
+
+def store_pages(cur, pages, linked_exercise_ids=()):
+    """
+    Remembers the pages just written, in the same transaction as the write. Linked
+    exercises whose workout isn't there were skipped by the upsert, so they are left
+    out and get another go once the workout arrives.
+    """
+    if pages:
+        extras.execute_values(cur, """
+            INSERT INTO notion_page_cache (page_id, last_edited_time, payload)
+            VALUES %s
+            ON CONFLICT (page_id) DO UPDATE SET
+              last_edited_time = EXCLUDED.last_edited_time,
+              payload = EXCLUDED.payload
+        """, [(page_id(p), p["last_edited_time"], orjson.dumps(p).decode()) for p in pages], page_size=1000)
+
+    if linked_exercise_ids:
+        cur.execute("""
+            DELETE FROM notion_page_cache c
+            WHERE c.page_id = ANY(%s)
+              AND NOT EXISTS (SELECT 1 FROM exercises e WHERE e.notion_id = c.page_id)
+        """, (list(linked_exercise_ids),))
+
+def evict_pages(cur, page_ids):
+    # Any write that didn't come from a cached page makes the cached version stale
+    page_ids = [i for i in page_ids if i]
+    if page_ids:
+        cur.execute("DELETE FROM notion_page_cache WHERE page_id = ANY(%s)", (page_ids,))
+
+def clear_page_cache(cur):
+    cur.execute("TRUNCATE notion_page_cache")
@@ -0,0 +1,156 @@
+from psycopg2.extras import RealDictCursor
+from connections import get_fitness_connection
+
+# The merged sets change with either side of the link and with the category mapping
+SET_LINK_TABLES = ("workouts", "exercises", "garmin_strength_exercises", "garmin_exercise_map")
+
+GARMIN_EXERCISE_MAP_SQL = """
+    CREATE TABLE IF NOT EXISTS garmin_exercise_map (
+        category    text NOT NULL,
+        garmin_name text NOT NULL DEFAULT '',  -- '' covers the whole category
+        name        text NOT NULL,             -- exercise_meta name
+        PRIMARY KEY (category, garmin_name)
+    );
+
+    INSERT INTO garmin_exercise_map (category, garmin_name, name) VALUES
+    ('CURL','','Bicep Curl'),
+    ('ROW','','One-Arm Row'),
+    ('BENCH_PRESS','','Bench Press'),
+    ('FLYE','','Chest Fly'),
+    ('LATERAL_RAISE','','Lateral Raise'),
+    ('SHOULDER_PRESS','','Shoulder Press'),
+    ('SHRUG','','Shrug'),
+    ('TRICEPS_EXTENSION','','Kickbacks'),
+    ('PULL_UP','','Pull-up'),
+    ('PUSH_UP','','Push-up'),
+    ('CRUNCH','','Crunch'),
+    ('SIT_UP','','Sit-Up'),
+    ('PLANK','','Plank'),
+    ('LEG_RAISE','','Leg raises'),
+    ('HIP_RAISE','','Glute Bridge'),
+    ('LUNGE','','Step back Lunge'),
+    ('CALF_RAISE','','Heel Drop'),
+    ('DEADLIFT','ROMANIAN_DEADLIFT','RDL'),
+    ('CORE','RUSSIAN_TWIST','Russian Twist')
+    ON CONFLICT (category, garmin_name) DO UPDATE SET
+    name = EXCLUDED.name;
+"""
+
+SET_LINKS_SQL = """
+    CREATE INDEX IF NOT EXISTS ix_workouts_date ON workouts (date);
+    CREATE INDEX IF NOT EXISTS ix_garmin_strength_exercises_start_time ON garmin_strength_exercises (start_time);
+
+    CREATE TABLE IF NOT EXISTS strength_set_links (
+        activity_id       text NOT NULL,
+        exercise_id       text NOT NULL,
+        workout_notion_id text NOT NULL,
+        name              text NOT NULL,
+        d                 date NOT NULL,
+        set_number        int NOT NULL,
+        PRIMARY KEY (activity_id, exercise_id)
+    );
+    CREATE INDEX IF NOT EXISTS ix_strength_set_links_d ON strength_set_links (d);
+    CREATE INDEX IF NOT EXISTS ix_strength_set_links_exercise ON strength_set_links (workout_notion_id, name);
+"""
+
+# Notion only knows the workout's date, so the time window is that day: a range on the
+# sets' start_time that the index above serves, one probe per workout. A set's specific
+# Garmin name wins over the category-wide mapping, and with two workouts on one day
+# the set goes to the first one so it is linked at most once.
+LINK_INSERT_SQL = """
+    INSERT INTO strength_set_links (activity_id, exercise_id, workout_notion_id, name, d, set_number)
+    SELECT activity_id, exercise_id, workout_notion_id, name, d,
+           row_number() OVER (PARTITION BY workout_notion_id, name ORDER BY start_time, exercise_id)
+    FROM (
+        SELECT DISTINCT ON (S.activity_id, S.exercise_id)
+               S.activity_id, S.exercise_id, S.start_time, E.workout_notion_id, E.name, W.date AS d
+        FROM workouts W
+        JOIN garmin_strength_exercises S
+          ON S.start_time >= W.date
+         AND S.start_time < W.date + 1
+        CROSS JOIN LATERAL (
+            SELECT m.name
+            FROM garmin_exercise_map m
+            WHERE m.category = S.category
+              AND m.garmin_name IN (COALESCE(S.exercise_name, ''), '')
+            ORDER BY m.garmin_name = ''
+            LIMIT 1
+        ) m
+        JOIN exercises E
+          ON E.workout_notion_id = W.notion_id
+         AND E.name = m.name
+        WHERE W.date IS NOT NULL {filter}
+        ORDER BY S.activity_id, S.exercise_id, W.notion_id
+    ) matched
+"""
+
+# One row per Garmin set linked to its Notion exercise: Garmin's timing, rest and
+# counted reps next to the weight and RIR logged in Notion
+MERGED_SETS_VIEW = """
+    CREATE OR REPLACE VIEW vw_strength_sets_merged AS
+    SELECT
+        L.d,
+        L.workout_notion_id,
+        L.name AS exercise,
+        COALESCE(E.variation,'') AS variation,
+        L.set_number,
+        E.sets AS logged_sets,
+        S.activity_id,
+        S.exercise_id,
+        S.category,
+        S.exercise_name AS garmin_exercise,
+        S.start_time,
+        S.end_time,
+        S.duration,
+        S.rest_duration,
+        COALESCE(NULLIF(S.repetitions, 0), E.reps) AS reps,
+        S.repetitions AS garmin_reps,
+        E.reps AS logged_reps,
+        E.weight,
+        S.weight AS garmin_weight,
+        E.rir
+    FROM strength_set_links L
+    JOIN garmin_strength_exercises S
+      ON S.activity_id = L.activity_id
+     AND S.exercise_id = L.exercise_id
+    JOIN exercises E
+      ON E.workout_notion_id = L.workout_notion_id
+     AND E.name = L.name;
+"""
+
+def init_set_links(cur):
+    cur.execute(GARMIN_EXERCISE_MAP_SQL)
+    cur.execute(SET_LINKS_SQL)
+    cur.execute(MERGED_SETS_VIEW)
+
+def refresh_set_links(cur, days=None):
+    """Relinks the sets of the given workout days, or of everything when None."""
+    if days is None:
+        cur.execute("TRUNCATE strength_set_links")
+        cur.execute(LINK_INSERT_SQL.format(filter=""))
+        return
+    if not days:
+        return
+    days = sorted(days)
+    cur.execute("DELETE FROM strength_set_links WHERE d = ANY(%s::date[])", (days,))
+    cur.execute(LINK_INSERT_SQL.format(filter="AND W.date = ANY(%(days)s::date[])"), {"days": days})
+
+def refresh_activity_links(cur, activity_ids):
+    # New Garmin sets only know their start time; relink the days they fall on
+    cur.execute("""
+        SELECT DISTINCT start_time::date FROM garmin_strength_exercises
+        WHERE activity_id = ANY(%s) AND start_time IS NOT NULL
+    """, (list(activity_ids),))
+    refresh_set_links(cur, [row[0] for row in cur.fetchall()])
+
+def fetch_merged_sets(date_from=None, date_to=None, exercise=None):
+    with get_fitness_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT * FROM vw_strength_sets_merged
+                WHERE (%(date_from)s::date IS NULL OR d >= %(date_from)s::date)
+                  AND (%(date_to)s::date IS NULL OR d <= %(date_to)s::date)
+                  AND (%(exercise)s::text IS NULL OR exercise = %(exercise)s)
+                ORDER BY d, workout_notion_id, start_time
+            """, {"date_from": date_from, "date_to": date_to, "exercise": exercise})
+            return cur.fetchall()
@@ -0,0 +1,33 @@
+from enum import Enum
+from typing import Optional
+from fastapi import APIRouter, Request, Response, Query
+from versions import etag_response
+from workouts.data import fetch_personal_records, RECORD_TABLES
+
+router = APIRouter()
+
+class Source(str, Enum):
+    notion = "notion"
+    garmin = "garmin"
+
+class Record(str, Enum):
+    e1rm = "e1rm"
+    weight = "weight"
+    session_volume = "session_volume"
+
+@router.get("", summary="Personal records per exercise: best e1RM, best weight per rep count and best session volume")
+def get_records(
+    request: Request,
+    response: Response,
+    source: Optional[Source] = Query(None),
+    exercise: Optional[str] = Query(None),
+    variation: Optional[str] = Query(None),
+    record: Optional[Record] = Query(None)):
+    not_modified = etag_response(request, response, *RECORD_TABLES)
+    if not_modified:
+        return not_modified
+    return fetch_personal_records(
+        source.value if source else None,
+        exercise,
+        variation,
+        record.value if record else None)
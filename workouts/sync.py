@@ -1,24 +1,121 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
 from fastapi import APIRouter, Request
+from fastapi.concurrency import run_in_threadpool
 import workouts.notion as notion
 import workouts.data as data
+import workouts.page_cache as page_cache
+from workouts.coalesce import write_lock
 
+# Spotting deletions means listing every page id of both databases, so /sync only does it
+# this often; the deleted webhooks and /resync remove pages in between
+DELETION_CHECK_HOURS = float(os.getenv("NOTION_DELETION_CHECK_HOURS", "24"))
+
+_deletions_checked_at = None
+
+# Only the Notion requests are awaited on the event loop; parsing and the database work run
+# in the threadpool, as in coalesce, so webhooks keep coming in during a long sync
 router = APIRouter()
+@router.post("/sync")
+async def sync():
+    async with write_lock:
+        return await _sync()
+
+async def _sync():
+    workout_pages, exercise_pages = await asyncio.gather(
+        changed_pages(notion.WORKOUTS_DB_ID),
+        changed_pages(notion.EXERCISES_DB_ID),
+    )
+    # The boundary minute is listed again on every sync; pages we already have are skipped
+    (workout_changes, exercise_changes), hits = await run_in_threadpool(page_cache.drop_unchanged, workout_pages, exercise_pages)
+    workouts, exercises, unlinked = await run_in_threadpool(parse_pages, workout_changes, exercise_changes)
+    await run_in_threadpool(data.bulk_upsert, workouts, exercises, unlinked, workout_changes + exercise_changes)
+
+    deleted_workouts = deleted_exercises = 0
+    check_deletions = deletion_check_due()
+    if check_deletions:
+        deleted_workouts = await delete_removed_pages(
+            notion.WORKOUTS_DB_ID, await run_in_threadpool(data.fetch_workout_ids), data.delete_workout)
+        deleted_exercises = await delete_removed_pages(
+            notion.EXERCISES_DB_ID, await run_in_threadpool(data.fetch_exercise_notion_ids), data.delete_exercise_by_notion_id)
+        mark_deletions_checked()
+
+    await run_in_threadpool(mark_synced, notion.WORKOUTS_DB_ID, workout_pages)
+    await run_in_threadpool(mark_synced, notion.EXERCISES_DB_ID, exercise_pages)
+    return {
+        "status": "ok",
+        "workouts": {"changed": len(workout_changes), "deleted": deleted_workouts},
+        "exercises": {"changed": len(exercise_changes), "deleted": deleted_exercises},
+        "deletions_checked": check_deletions,
+        "cache": page_cache.cache_report("sync", hits, len(workout_pages) + len(exercise_pages)),
+    }
+
 @router.post("/resync")
 async def resync():
-    data.delete_all_workouts_and_exercises()
+    # Held from the fetch to the swap: a webhook write in between would be replaced by the
+    # older snapshot, so webhooks queue up and are applied on top once the swap is in
+    async with write_lock:
+        return await _resync()
+
+async def _resync():
+    workout_pages, exercise_pages = await notion.fetch_all_workouts_and_exercises()
+    workouts, exercises, _ = await run_in_threadpool(parse_pages, workout_pages, exercise_pages)
+    # A resync is the repair path, so every page is rewritten; the hits only show how much was unchanged
+    pages = workout_pages + exercise_pages
+    hits = len(await run_in_threadpool(page_cache.unchanged_page_ids, pages))
+    await run_in_threadpool(data.build_shadow, workouts, exercises)
+    await run_in_threadpool(data.swap_shadow, pages, [e[-1] for e in exercises])
+
+    await run_in_threadpool(data.clear_sync_state)
+    mark_deletions_checked()
+    await run_in_threadpool(mark_synced, notion.WORKOUTS_DB_ID, workout_pages)
+    await run_in_threadpool(mark_synced, notion.EXERCISES_DB_ID, exercise_pages)
+    return {"status": "ok", "cache": page_cache.cache_report("resync", hits, len(pages))}
 
-    workouts = notion.fetch_all_workouts()
-    for page in workouts:
-        notion_id, date, personal_notes, coach_notes, metadata = notion.parse_workout(page)
-        data.create_workout(notion_id, date, personal_notes, coach_notes, metadata)
+async def changed_pages(db_id):
+    since = await run_in_threadpool(data.get_sync_state, db_id)
+    if since:
+        return await notion.fetch_rows_edited_since(db_id, since)
+    return await notion.fetch_all_rows(db_id)
 
-    exercises = notion.fetch_all_exercises()
-    for page in exercises:
+def parse_pages(workout_pages, exercise_pages):
+    workouts = [notion.parse_workout(page) for page in workout_pages]
+    exercises = []
+    unlinked = []
+    for page in exercise_pages:
+        notion_id = page["id"].replace("-", "")
         parsed = notion.parse_exercise(page)
         if parsed:
-            workout_notion_id, exercise_name, variation, sets, reps, weight, rir, notes, metadata = parsed
-            data.create_exercise(workout_notion_id, exercise_name, variation, sets, reps, weight, rir, notes, metadata)
+            exercises.append((*parsed, notion_id))
+        else:
+            # Unlinked from its workout since the last sync
+            unlinked.append(notion_id)
+    return workouts, exercises, unlinked
+
+def deletion_check_due():
+    return _deletions_checked_at is None or datetime.now() - _deletions_checked_at >= timedelta(hours=DELETION_CHECK_HOURS)
+
+def mark_deletions_checked():
+    global _deletions_checked_at
+    _deletions_checked_at = datetime.now()
 
-    return {"status": "ok"}
+async def delete_removed_pages(db_id, local_ids, delete):
+    # Queries leave out archived and trashed pages, so anything we have that the listing
+    # lacks is a candidate; fetching it settles whether it was really deleted
+    candidates = list(local_ids - await notion.fetch_row_ids(db_id))
+    pages = await notion.fetch_pages(candidates)
+    deleted = 0
+    for page_id, page in zip(candidates, pages):
+        if notion.is_page_deleted(page):
+            await run_in_threadpool(delete, page_id)
+            deleted += 1
+    return deleted
 
+def mark_synced(db_id, pages):
+    # The high-water mark comes from Notion's own timestamps, never from our clock
+    if pages:
+        data.set_sync_state(db_id, max(last_edited_time(page) for page in pages))
 
+def last_edited_time(page):
+    return datetime.fromisoformat(page["last_edited_time"].replace("Z", "+00:00"))
@@ -0,0 +1,125 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from statistics import mean, pstdev
+from psycopg2 import extras
+
+# Exponentially weighted acute (7 day) and chronic (28 day) load, decayed as 2 / (N + 1)
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+ACUTE_DECAY = 2 / (ACUTE_DAYS + 1)
+CHRONIC_DECAY = 2 / (CHRONIC_DAYS + 1)
+
+# Monotony and strain are taken over the trailing week
+MONOTONY_DAYS = 7
+
+TOTAL_SERIES = "volume"
+GARMIN_SERIES = "garmin"
+
+TRAINING_LOAD_SQL = """
+    CREATE TABLE IF NOT EXISTS training_load_daily (
+        series   text NOT NULL,  -- 'volume', a muscle group path, or 'garmin'
+        d        date NOT NULL,
+        load     double precision NOT NULL,
+        acute    double precision NOT NULL,
+        chronic  double precision NOT NULL,
+        acwr     double precision,
+        monotony double precision,
+        strain   double precision,
+        PRIMARY KEY (series, d)
+    );
+"""
+
+# Daily load per series: the total lifted volume, the volume credited to every muscle
+# group and Garmin's own training load per activity
+DAILY_LOADS_SQL = """
+    SELECT %(total)s AS series, d, SUM(volume)::double precision AS load
+    FROM vw_exercise_daily_volume
+    WHERE d >= %(from)s
+    GROUP BY d
+
+    UNION ALL
+    SELECT r.target_path, r.d, SUM(r.volume)::double precision
+    FROM target_daily_rollup r
+    JOIN muscle_taxonomy t ON t.path = r.target_path
+    WHERE t.level = 2
+      AND r.d >= %(from)s
+    GROUP BY r.target_path, r.d
+
+    UNION ALL
+    SELECT %(garmin)s, start_time::date, SUM((json_payload->>'activityTrainingLoad')::double precision)
+    FROM garmin_activities
+    WHERE start_time >= %(from)s
+      AND json_payload->>'activityTrainingLoad' IS NOT NULL
+    GROUP BY start_time::date
+"""
+
+def init_training_load(cur):
+    cur.execute(TRAINING_LOAD_SQL)
+
+def refresh_training_load(cur, since=None):
+    """
+    Recomputes every series from `since` (everything when None) up to today. The
+    weighted loads carry over from the last stored day before `since`, so a new workout
+    only costs the days after it. Rows stop at the day of the previous refresh, so the
+    days between it and `since` are filled in from there.
+    """
+    seeds = {}
+    window_start = date.min
+    if since:
+        cur.execute("""
+            SELECT DISTINCT ON (series) series, d, acute, chronic
+            FROM training_load_daily
+            WHERE d < %s
+            ORDER BY series, d DESC
+        """, (since,))
+        seeds = {series: (d, acute, chronic) for series, d, acute, chronic in cur.fetchall()}
+        first_day = min([since] + [d + timedelta(days=1) for d, _, _ in seeds.values()])
+        window_start = first_day - timedelta(days=MONOTONY_DAYS - 1)
+
+    cur.execute(DAILY_LOADS_SQL, {"from": window_start, "total": TOTAL_SERIES, "garmin": GARMIN_SERIES})
+    loads = defaultdict(dict)
+    for series, d, load in cur.fetchall():
+        loads[series][d] = load
+
+    if since:
+        cur.execute("DELETE FROM training_load_daily WHERE d >= %s", (since,))
+    else:
+        cur.execute("TRUNCATE training_load_daily")
+
+    last_day = max([date.today()] + [d for days in loads.values() for d in days])
+    rows = []
+    for series in set(loads) | set(seeds):
+        rows.extend(_series_rows(series, loads[series], seeds.get(series), since, last_day))
+
+    if rows:
+        extras.execute_values(cur, """
+            INSERT INTO training_load_daily (series, d, load, acute, chronic, acwr, monotony, strain)
+            VALUES %s
+        """, rows, page_size=1000)
+
+def _series_rows(series, loads, seed, since, last_day):
+    if seed:
+        seed_day, acute, chronic = seed
+        start = seed_day + timedelta(days=1)
+    elif loads:
+        # Without a seed the series starts at its first recorded load
+        acute, chronic = 0.0, 0.0
+        start = max(since, min(loads)) if since else min(loads)
+    else:
+        return []
+
+    rows = []
+    day = start
+    while day <= last_day:
+        load = loads.get(day, 0.0)
+        acute = ACUTE_DECAY * load + (1 - ACUTE_DECAY) * acute
+        chronic = CHRONIC_DECAY * load + (1 - CHRONIC_DECAY) * chronic
+
+        week = [loads.get(day - timedelta(days=i), 0.0) for i in range(MONOTONY_DAYS)]
+        deviation = pstdev(week)
+        monotony = mean(week) / deviation if deviation else None
+        strain = sum(week) * monotony if monotony is not None else None
+
+        rows.append((series, day, load, acute, chronic, acute / chronic if chronic else None, monotony, strain))
+        day += timedelta(days=1)
+    return rows
@@ -1,30 +1,26 @@
 from fastapi import APIRouter, Request
-from workouts.data import (create_workout, delete_workout)
-from workouts.notion import (fetch_notion_page, parse_workout)
+from fastapi.concurrency import run_in_threadpool
+from workouts.data import delete_workout
+from workouts.coalesce import WORKOUT, enqueue, discard, write_lock
 
 router = APIRouter()
 @router.post("/added")
 async def workout_added(req: Request):
     page_id = (await req.json())["page_id"]
-    page = fetch_notion_page(page_id)
-    notion_id, date, metadata = parse_workout(page)
-    create_workout(notion_id, date, metadata)
+    enqueue(WORKOUT, page_id)
     return {"status": "ok"}
 
 @router.post("/changed")
 async def workout_changed(req: Request):
     page_id = (await req.json())["page_id"]
-    notion_id = page_id.replace("-", "")
-    delete_workout(notion_id)
-
-    page = fetch_notion_page(page_id)
-    notion_id, date, metadata = parse_workout(page)
-    create_workout(notion_id, date, metadata)
+    enqueue(WORKOUT, page_id)
     return {"status": "ok"}
 
 @router.post("/deleted")
 async def workout_deleted(req: Request):
     page_id = (await req.json())["page_id"]
     notion_id = page_id.replace("-", "")
-    delete_workout(notion_id)
+    discard(notion_id)
+    async with write_lock:
+        await run_in_threadpool(delete_workout, notion_id)
     return {"status": "ok"}
\ No newline at end of file